@@ -1,27 +1,39 @@
 from flask import Flask, jsonify, send_from_directory
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from werkzeug.security import generate_password_hash
 from datetime import datetime, date, timedelta
+import click
 import os
 
 from config.config import Config
+from config.engine_profiles import engine_options, bind_options, install_engine_events
 from redis import Redis
 from models import db, User, Department, Doctor, Patient, Appointment, Treatment, DoctorAvailability
+from migrations import run_migrations
+from cache import register_cache_invalidation
+from stats import register_stats_listeners
+from models.routing import register_replica_routing
+from imports import IMPORT_KINDS, run_import, report_chunks, detect_format
+from passwords import password_hasher
 
 def create_app():
     app = Flask(__name__, static_folder='../frontend', static_url_path='')
     app.config.from_object(Config)
     
     # Initialize extensions
-    CORS(app)
+    CORS(app, expose_headers=['ETag'])  # the SPA reads ETags for If-None-Match
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    app.config['SQLALCHEMY_BINDS'] = bind_options(app.config)
     db.init_app(app)
-    JWTManager(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            install_engine_events(engine, app.config)
+    jwt = JWTManager(app)
     # Redis client for caching/queues
     app.redis = Redis.from_url(app.config['REDIS_URL'])
     
     # Import routes
-    from routes.auth import auth_bp
+    from routes.auth import auth_bp, register_jwt_callbacks
     from routes.admin import admin_bp
     from routes.doctor import doctor_bp
     from routes.patient import patient_bp
@@ -31,6 +43,10 @@ def create_app():
     app.register_blueprint(admin_bp, url_prefix='/api/admin')
     app.register_blueprint(doctor_bp, url_prefix='/api/doctor')
     app.register_blueprint(patient_bp, url_prefix='/api/patient')
+    register_jwt_callbacks(jwt)
+    register_cache_invalidation()
+    register_stats_listeners()
+    register_replica_routing()
 
     # Initialize Celery (tasks and beat schedule)
     try:
@@ -49,13 +65,39 @@ def create_app():
     def health():
         return jsonify({'status': 'healthy'}), 200
     
-    # Initialize database and create admin
-    with app.app_context():
-        db.create_all()
-        init_database()
+    # Schema and seed data are an explicit step, not part of every boot
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create tables, apply migrations and seed the admin user and departments."""
+        setup_database()
+        print('Database ready')
+    
+    @app.cli.command('import-users')
+    @click.argument('kind', type=click.Choice(sorted(IMPORT_KINDS)))
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension')
+    @click.option('--report', type=click.Path(dir_okay=False), help='CSV file for rows that failed')
+    def import_users_command(kind, path, fmt, report):
+        """Bulk-create doctor or patient accounts from a CSV or NDJSON file."""
+        with open(path, encoding='utf-8-sig', newline='') as lines:
+            result = run_import(kind, lines, detect_format(path, fmt))
+        print(f"Created {result['created']} {kind}, {result['failed']} failed")
+        if result['errors'] and report:
+            with open(report, 'wb') as f:
+                for chunk in report_chunks(result['errors']):
+                    f.write(chunk)
+            print(f'Error report written to {report}')
+        for line, username, email, error in result['errors'][:10] if not report else []:
+            print(f'  line {line} ({username}): {error}')
     
     return app
 
+def setup_database():
+    """Create missing tables, apply pending migrations and seed defaults (idempotent)"""
+    db.create_all()
+    run_migrations()
+    init_database()
+
 def init_database():
     """Initialize database with admin user and sample departments"""
     # Check if admin exists
@@ -64,7 +106,7 @@ def init_database():
         admin = User(
             username='admin',
             email='admin@hospital.com',
-            password=generate_password_hash('admin123'),
+            password=password_hasher()('admin123'),
             role='admin',
             is_active=True
         )
@@ -89,5 +131,9 @@ def init_database():
 
 if __name__ == '__main__':
     app = create_app()
+    # Development server: prepare the database once, not again in the reloader child
+    if os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        with app.app_context():
+            setup_database()
     app.run(debug=True, host='0.0.0.0', port=5001)
 
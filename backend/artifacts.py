@@ -0,0 +1,101 @@
+"""Filesystem store for generated export files
+
+Celery tasks write artifacts here and keep only the metadata as their result;
+the API serves the stored file. Web and worker processes must share EXPORT_DIR.
+"""
+from flask import current_app
+from datetime import datetime
+import gzip
+import json
+import os
+import re
+import shutil
+import time
+
+_ARTIFACT_ID = re.compile(r'^[A-Za-z0-9-]{1,64}$')
+
+
+def artifact_dir():
+    path = current_app.config.get('EXPORT_DIR') or os.path.join(current_app.instance_path, 'exports')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def artifact_path(artifact_id):
+    """Path of the stored bytes; raises ValueError for ids that could escape the store"""
+    if not _ARTIFACT_ID.match(artifact_id or ''):
+        raise ValueError('Invalid artifact id')
+    return os.path.join(artifact_dir(), f'{artifact_id}.bin')
+
+
+def plain_artifact_path(artifact_id):
+    """Path of a decompressed copy of a gzip artifact, written on first use"""
+    path = artifact_path(artifact_id)
+    plain_path = f'{path[:-4]}.plain'
+    if not os.path.exists(plain_path):
+        tmp_path = f'{plain_path}.{os.getpid()}.tmp'
+        with gzip.open(path, 'rb') as src, open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 64 * 1024)
+        os.replace(tmp_path, plain_path)
+    return plain_path
+
+
+def save_artifact(artifact_id, chunks, **meta):
+    """Write byte chunks to the store and return the artifact metadata"""
+    path = artifact_path(artifact_id)
+    tmp_path = f'{path}.tmp'
+    size = 0
+    with open(tmp_path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+            size += len(chunk)
+    os.replace(tmp_path, path)
+    meta.update({
+        'artifact_id': artifact_id,
+        'size': size,
+        'created_at': datetime.utcnow().isoformat()
+    })
+    with open(f'{path[:-4]}.json', 'w') as f:
+        json.dump(meta, f)
+    return meta
+
+
+def delete_artifact(artifact_id):
+    """Remove an artifact and its metadata (and decompressed copy, if any)"""
+    path = artifact_path(artifact_id)
+    for name in (path, f'{path[:-4]}.json', f'{path[:-4]}.plain'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def load_artifact_meta(artifact_id):
+    """Metadata of a stored artifact, or None if missing or expired"""
+    try:
+        path = artifact_path(artifact_id)
+    except ValueError:
+        return None
+    meta_path = f'{path[:-4]}.json'
+    if not os.path.exists(path) or not os.path.exists(meta_path):
+        return None
+    if time.time() - os.path.getmtime(path) > current_app.config['EXPORT_TTL']:
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def purge_expired_artifacts():
+    """Delete artifacts older than EXPORT_TTL; returns how many files were removed"""
+    root = artifact_dir()
+    cutoff = time.time() - current_app.config['EXPORT_TTL']
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            pass
+    return removed
@@ -0,0 +1 @@
+"""Performance benchmarks; run from backend/ as ``python -m benchmarks.<name> --help``"""
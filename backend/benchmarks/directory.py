@@ -0,0 +1,55 @@
+"""Patient doctor directory: latency and statements as the number of doctors grows
+
+    python -m benchmarks.directory [--doctors 50,100,200,400] [--repeat 20]
+
+"cold" rebuilds the in-memory snapshot on every request, which is the path
+that loads availability and departments; "warm" is served from the snapshot.
+Both should stay flat in statements, and cold latency should grow only with
+the rows returned.
+"""
+import argparse
+
+import directory
+from benchmarks.harness import bench_app, login, timings, median_ms, int_list, report, StatementCounter, seed
+
+
+def run(sizes, repeat):
+    from models import db
+    rows = []
+    for n_doctors in sizes:
+        with bench_app() as app:
+            seed(n_doctors=n_doctors, n_patients=1)
+            client = app.test_client()
+            headers = login(client, 'pat0')
+
+            def cold():
+                directory._snapshot = None
+                db.session.remove()
+                response = client.get('/api/patient/doctors', headers=headers)
+                assert response.status_code == 200
+
+            def warm():
+                assert client.get('/api/patient/doctors', headers=headers).status_code == 200
+
+            with StatementCounter(db.engine) as counter:
+                cold()
+            rows.append((
+                n_doctors,
+                f'{median_ms(timings(cold, repeat)):.1f}',
+                len(counter),
+                f'{median_ms(timings(warm, repeat)):.1f}',
+            ))
+    report('GET /api/patient/doctors', ['doctors', 'cold ms', 'cold statements', 'warm ms'], rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--doctors', type=int_list, default=[50, 100, 200, 400])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+    return run(args.doctors, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
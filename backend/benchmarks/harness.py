@@ -0,0 +1,108 @@
+"""Shared setup for the benchmarks: a throwaway app, timers and result tables
+
+Each benchmark builds its app against a temporary SQLite file (or the database
+it is given) with the in-memory Redis stand-in from tests/support.py, unless
+BENCH_REDIS_URL points at a real Redis.
+"""
+from contextlib import contextmanager, redirect_stdout
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import Config
+from tests.support import FakeRedis, StatementCounter, TEST_HASH_METHOD, seed, add_appointments
+
+
+@contextmanager
+def bench_app(database_url=None, **config):
+    """App with a fresh schema inside an app context; config overrides Config attributes"""
+    from redis import Redis
+    from app import create_app, setup_database
+    from models import db
+    import cache
+    import directory
+    import passwords
+
+    tmp_dir = tempfile.mkdtemp(prefix='hms-bench-')
+    overrides = {
+        'SQLALCHEMY_DATABASE_URI': database_url or f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+        'PASSWORD_HASH_METHOD': TEST_HASH_METHOD,
+        **config,
+    }
+    saved = {key: getattr(Config, key) for key in overrides}
+    try:
+        for key, value in overrides.items():
+            setattr(Config, key, value)
+        directory._snapshot = None
+        # Each app gets its own L1, as a new process would
+        cache._local_pid = None
+        cache._subscribed = threading.Event()
+        passwords._pool_pid = None  # hashing pool sized from this app's config
+        app = create_app()
+        app.config['EXPORT_DIR'] = os.path.join(tmp_dir, 'exports')
+        app.redis = Redis.from_url(os.environ['BENCH_REDIS_URL']) if os.environ.get('BENCH_REDIS_URL') else FakeRedis()
+        with app.app_context():
+            with redirect_stdout(io.StringIO()):
+                setup_database()
+            try:
+                yield app
+            finally:
+                db.session.remove()
+                for engine in db.engines.values():
+                    engine.dispose()
+    finally:
+        for key, value in saved.items():
+            setattr(Config, key, value)
+        directory._snapshot = None
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def login(client, username, password='pw'):
+    """Authorization header for a user"""
+    response = client.post('/api/auth/login', json={'username': username, 'password': password})
+    if response.status_code != 200:
+        raise RuntimeError(f'Login as {username} failed: {response.get_json()}')
+    return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+
+
+def timings(fn, repeat):
+    """Wall-clock seconds of repeat calls to fn"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def median_ms(samples):
+    return statistics.median(samples) * 1000
+
+
+def int_list(value):
+    """argparse type for comma-separated integers"""
+    return [int(part) for part in value.split(',') if part]
+
+
+def report(title, headers, rows):
+    """Print rows as an aligned plain-text table"""
+    cells = [[str(cell) for cell in row] for row in rows]
+    widths = [max(len(str(header)), *(len(row[i]) for row in cells)) for i, header in enumerate(headers)]
+    print(title)
+    print('  '.join(str(header).rjust(width) for header, width in zip(headers, widths)))
+    for row in cells:
+        print('  '.join(cell.rjust(width) for cell, width in zip(row, widths)))
+    print()
+
+
+__all__ = [
+    'bench_app', 'login', 'timings', 'median_ms', 'int_list', 'report',
+    'StatementCounter', 'seed', 'add_appointments',
+]
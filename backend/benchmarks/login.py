@@ -0,0 +1,83 @@
+"""Login throughput at several password hashing costs
+
+    python -m benchmarks.login [--methods pbkdf2:sha256:600000,scrypt:16384:8:1,scrypt:32768:8:1]
+                               [--threads 8] [--logins 10] [--workers N] [--queue 32]
+
+For each PASSWORD_HASH_METHOD the users' hashes are made with that method,
+then --threads clients log in --logins times each. "hash ms" is one hash on an
+idle pool. Logins beyond the hashing pool (--workers, default one per CPU) and
+its --queue get 503; they are counted, not retried.
+"""
+import argparse
+import os
+import threading
+import time
+
+from werkzeug.security import generate_password_hash
+
+from benchmarks.harness import bench_app, timings, median_ms, report, seed
+
+METHODS = ['pbkdf2:sha256:600000', 'scrypt:16384:8:1', 'scrypt:32768:8:1']
+
+
+def _methods(value):
+    return [method for method in value.split(',') if method]
+
+
+def run(methods, threads, logins, workers, queue):
+    from models import db, User
+    from passwords import hash_password
+    rows = []
+    for method in methods:
+        with bench_app(PASSWORD_HASH_METHOD=method, PASSWORD_HASH_WORKERS=workers, PASSWORD_HASH_QUEUE=queue) as app:
+            seed(n_doctors=0, n_patients=threads)
+            password = generate_password_hash('pw', method=method)
+            User.query.filter(User.role == 'patient').update({User.password: password})
+            db.session.commit()
+            hash_ms = median_ms(timings(lambda: hash_password('pw'), 3))
+
+            latencies, statuses = [], []
+
+            def log_in(i):
+                client = app.test_client()
+                for _ in range(logins):
+                    start = time.perf_counter()
+                    response = client.post('/api/auth/login', json={'username': f'pat{i}', 'password': 'pw'})
+                    latencies.append(time.perf_counter() - start)
+                    statuses.append(response.status_code)
+
+            clients = [threading.Thread(target=log_in, args=(i,)) for i in range(threads)]
+            start = time.perf_counter()
+            for thread in clients:
+                thread.start()
+            for thread in clients:
+                thread.join()
+            elapsed = time.perf_counter() - start
+            ok = statuses.count(200)
+            rows.append((
+                method,
+                f'{hash_ms:.1f}',
+                f'{ok / elapsed:.1f}',
+                f'{median_ms(latencies):.1f}',
+                f'{sorted(latencies)[int(len(latencies) * 0.95)] * 1000:.1f}',
+                statuses.count(503),
+                len(statuses) - ok - statuses.count(503),
+            ))
+    report(f'{threads} clients x {logins} logins, {workers} hashing workers, queue {queue}',
+           ['method', 'hash ms', 'logins/s', 'p50 ms', 'p95 ms', '503s', 'errors'], rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--methods', type=_methods, default=METHODS)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--logins', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--queue', type=int, default=32)
+    args = parser.parse_args(argv)
+    return run(args.methods, args.threads, args.logins, args.workers, args.queue)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Admin patient search: FTS5 trigram index vs. the ILIKE scan it replaced
+
+    python -m benchmarks.search [--patients 10000,100000] [--repeat 10]
+    python -m benchmarks.search --patients 1000000 --repeat 5   # seeding takes several minutes
+
+Times GET /api/admin/search and the first page of GET /api/admin/patients
+for a term matching one patient, a term matching about one in twenty, and a
+term matching none. "ilike" runs the same requests with the FTS table
+reported missing, which is the fallback text_search() takes.
+"""
+import argparse
+
+from benchmarks.harness import bench_app, login, timings, median_ms, int_list, report
+from models.search import _available
+
+FIRST = ['Anna', 'Ben', 'Clara', 'David', 'Elif', 'Farid', 'Grace', 'Hugo', 'Ines', 'Jonas']
+LAST = ['Schmidt', 'Okafor', 'Nakamura', 'Rossi', 'Novak', 'Silva', 'Haddad', 'Larsen', 'Kowalski', 'Moreau',
+        'Fischer', 'Mensah', 'Ivanova', 'Dubois', 'Tanaka', 'Costa', 'Jensen', 'Horvat', 'Bauer', 'Murphy']
+
+
+def seed_patients(n, batch=10000):
+    """Insert n patients (and their users) in bulk; the FTS triggers index them as they go"""
+    from models import db, User, Patient
+    first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    for start in range(0, n, batch):
+        stop = min(start + batch, n)
+        db.session.execute(db.insert(User), [
+            {'id': first_user + i, 'username': f'bulk{i}', 'email': f'bulk{i}@example.com',
+             'password': '-', 'role': 'patient', 'is_active': True}
+            for i in range(start, stop)
+        ])
+        db.session.execute(db.insert(Patient), [
+            {'user_id': first_user + i, 'name': f'{FIRST[i % len(FIRST)]} {LAST[i // len(FIRST) % len(LAST)]}',
+             'phone': f'555{i:07d}'}
+            for i in range(start, stop)
+        ])
+        db.session.commit()
+
+
+def run(sizes, repeat):
+    from models import db, Patient
+    from models.search import text_search
+    rows = []
+    for n_patients in sizes:
+        with bench_app() as app:
+            seed_patients(n_patients)
+            client = app.test_client()
+            headers = login(client, 'admin', 'admin123')
+            terms = [f'555{n_patients // 2:07d}', LAST[3], 'zzqx']
+            for term in terms:
+                matches = text_search(Patient.query, Patient, ['name', 'phone'], term).count()
+                for url in (f'/api/admin/search?type=patient&q={term}', f'/api/admin/patients?search={term}'):
+                    def request():
+                        db.session.remove()
+                        assert client.get(url, headers=headers).status_code == 200
+
+                    fts_ms = median_ms(timings(request, repeat))
+                    _available['patients_fts'] = False
+                    try:
+                        ilike_ms = median_ms(timings(request, repeat))
+                    finally:
+                        _available.pop('patients_fts')
+                    rows.append((n_patients, url.split('?')[0], term, matches,
+                                 f'{fts_ms:.1f}', f'{ilike_ms:.1f}', f'{ilike_ms / fts_ms:.1f}x'))
+    report('Admin patient search', ['patients', 'endpoint', 'term', 'matches', 'fts ms', 'ilike ms', 'speedup'], rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int_list, default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args(argv)
+    return run(args.patients, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
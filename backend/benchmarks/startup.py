@@ -0,0 +1,80 @@
+"""Cold start: import plus app factory, for web and Celery worker processes
+
+    python -m benchmarks.startup [--runs 10]
+
+Each sample is a fresh interpreter, so module imports are really cold.
+"web" imports app and calls create_app(), "worker" imports celery_tasks and
+calls get_flask_app(), and "web + init-db" adds the schema and seed step
+that used to run on every boot.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.harness import report
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_PROBE = """
+import json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+app = {factory}
+built = time.perf_counter()
+if {init_db}:
+    import contextlib, io
+    with app.app_context(), contextlib.redirect_stdout(io.StringIO()):
+        from app import setup_database
+        setup_database()
+done = time.perf_counter()
+print(json.dumps([imported - start, done - imported]))
+"""
+
+MODES = {
+    'web': ('app', 'app.create_app()', False),
+    'worker': ('celery_tasks', 'celery_tasks.get_flask_app()', False),
+    'web + init-db': ('app', 'app.create_app()', True),
+}
+
+
+def _sample(mode, env):
+    module, factory, init_db = MODES[mode]
+    output = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(module=module, factory=factory, init_db=init_db)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(runs):
+    rows = []
+    with tempfile.TemporaryDirectory(prefix='hms-bench-') as tmp_dir:
+        env = {
+            **os.environ,
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+            'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        }
+        _sample('web + init-db', env)  # the database exists, as in production
+        for mode in MODES:
+            samples = [_sample(mode, env) for _ in range(runs)]
+            import_ms = statistics.median(s[0] for s in samples) * 1000
+            factory_ms = statistics.median(s[1] for s in samples) * 1000
+            rows.append((mode, f'{import_ms:.0f}', f'{factory_ms:.1f}', f'{import_ms + factory_ms:.0f}'))
+    report('Cold start (median of fresh interpreters)', ['process', 'import ms', 'factory ms', 'total ms'], rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(argv)
+    return run(args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Celery task overhead: an empty task on the worker-lifetime app vs. building an app per task
+
+    python -m benchmarks.task_overhead [--tasks 500] [--rebuilds 10]
+
+Tasks run in-process through Task.apply(), so the numbers are the task
+wrapper's own cost (app context push, task body), not broker latency.
+"per-task app" repeats what every task used to pay: two create_app() calls,
+each followed by create_all() and the seed check.
+"""
+import argparse
+from contextlib import redirect_stdout
+import io
+import time
+
+import celery_tasks
+from celery_tasks import celery
+from benchmarks.harness import bench_app, timings, median_ms, report
+
+
+@celery.task(name='benchmarks.noop')
+def noop():
+    return None
+
+
+def _app_per_task():
+    from app import create_app, init_database
+    from models import db
+    for _ in range(2):
+        app = create_app()
+        with app.app_context(), redirect_stdout(io.StringIO()):
+            db.create_all()
+            init_database()
+
+
+def run(n_tasks, rebuilds):
+    with bench_app() as app:
+        saved, celery_tasks._flask_app = celery_tasks._flask_app, app
+        try:
+            noop.apply()  # warm up
+            start = time.perf_counter()
+            for _ in range(n_tasks):
+                noop.apply()
+            elapsed = time.perf_counter() - start
+            rebuild_ms = median_ms(timings(_app_per_task, rebuilds))
+        finally:
+            celery_tasks._flask_app = saved
+    rows = [
+        ('worker-lifetime app', f'{elapsed / n_tasks * 1000:.3f}', f'{n_tasks / elapsed:.0f}'),
+        ('per-task app (before)', f'{rebuild_ms:.1f}', f'{1000 / rebuild_ms:.0f}'),
+    ]
+    report('Empty task', ['mode', 'ms/task', 'tasks/s'], rows)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=500)
+    parser.add_argument('--rebuilds', type=int, default=10)
+    args = parser.parse_args(argv)
+    return run(args.tasks, args.rebuilds)
+
+
+if __name__ == '__main__':
+    main()
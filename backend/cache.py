@@ -0,0 +1,441 @@
+"""Redis response cache for JSON endpoints
+
+@cached(namespace, ttl) stores a view's response under a key built from the
+namespace, the caller's role (and user, for per_user endpoints) and the query
+string. Entries outlive their ttl by stale_ttl: once stale, one worker takes a
+short lock and recomputes while the others keep serving the old body. A cold
+key is likewise computed by one worker while the others wait for it.
+
+Entries are registered under cache tags (the namespace plus any extra tags the
+endpoint names). A session hook collects tags for every row flushed in a
+transaction and, once it commits, drops all entries under those tags in one
+Redis call, so handlers never invalidate by hand. Invalidating a tag also bumps
+its generation; a response computed across an invalidation is not stored.
+
+Fresh responses are also kept in a small per-process LRU (L1) in front of
+Redis (L2). Invalidations are published on a Redis channel and every process
+drops the matching L1 entries; L1 is only consulted while that subscription is
+up, so a process that may have missed a message falls back to Redis.
+
+Responses carry a strong ETag and If-None-Match gets a bodiless 304. Cached
+entries store the hash of their body, so a hit is answered without hashing or
+serializing anything; @conditional adds the same to uncached views.
+"""
+from flask import request, current_app, make_response, g, Response, has_app_context
+from flask_jwt_extended import get_jwt
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from collections import OrderedDict, Counter
+from functools import wraps
+from urllib.parse import urlencode
+from uuid import uuid4
+import hashlib
+import os
+import threading
+import time
+
+from models import User, Department, Doctor, Patient, Appointment, DoctorAvailability
+from models.routing import primary
+
+LOCK_TIMEOUT_MS = 10000
+# How long a request waits for another worker to fill a cold key before computing it itself
+COLD_WAIT = 2.0
+COLD_POLL = 0.05
+INVALIDATION_CHANNEL = 'cache:invalidate'
+# Tag generations only need to outlive a view computation
+GENERATION_TTL = 86400
+
+# Changed row -> tags whose cached entries it can affect
+TAGS_BY_MODEL = {
+    Appointment: lambda apt: ('dashboard', f'doctor:{apt.doctor_id}', f'patient:{apt.patient_id}'),
+    # Patient dashboards carry the 'departments' tag: they show doctor names and per-department counts
+    Doctor: lambda doc: ('dashboard', 'departments', f'doctor:{doc.id}'),
+    # Any doctor dashboard may list this patient's name and phone
+    Patient: lambda pat: ('dashboard', 'doctor-dashboard', f'patient:{pat.id}'),
+    Department: lambda dept: ('departments',),
+    DoctorAvailability: lambda avail: (f'doctor:{avail.doctor_id}',),
+    User: lambda user: _user_tags(user),
+}
+
+
+def _user_tags(user):
+    if user.role == 'doctor':
+        # Activating/deactivating a doctor changes the patient-facing department counts
+        return ('departments',)
+    if user.role == 'patient' and user.patient is not None:
+        # The patient dashboard shows the account email
+        return (f'patient:{user.patient.id}',)
+    return ()
+
+# Deletes every key listed in the given tag sets, then the sets themselves
+_INVALIDATE_SCRIPT = """
+local n = 0
+for _, tag in ipairs(KEYS) do
+    local members = redis.call('SMEMBERS', tag)
+    for i = 1, #members, 500 do
+        n = n + redis.call('DEL', unpack(members, i, math.min(i + 499, #members)))
+    end
+    redis.call('DEL', tag)
+end
+return n
+"""
+
+# Stores a computed entry and registers it under its tags, unless one of the tag
+# generations moved since the request read them (an invalidation ran meanwhile).
+# KEYS: entry key, generation keys, tag sets; ARGV: ttl, entry, generations read
+_STORE_SCRIPT = """
+local n = (#KEYS - 1) / 2
+for i = 1, n do
+    if (redis.call('GET', KEYS[1 + i]) or '') ~= ARGV[2 + i] then
+        return 0
+    end
+end
+redis.call('SETEX', KEYS[1], ARGV[1], ARGV[2])
+for i = 1, n do
+    redis.call('SADD', KEYS[1 + n + i], KEYS[1])
+    redis.call('EXPIRE', KEYS[1 + n + i], ARGV[1])
+end
+return 1
+"""
+
+# Releases a recompute lock only if it still holds this request's token
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def _tag_set(tag):
+    return f'cache:tag:{tag}'
+
+
+def _tag_generation(tag):
+    return f'cache:gen:{tag}'
+
+
+class LocalCache:
+    """Thread-safe LRU of decoded entries with per-entry expiry and a tag index"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, status, body, etag, tags)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2], entry[3]
+
+    def set(self, key, expires_at, status, body, etag, tags):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, status, body, etag, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        *_, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_local = None
+_local_pid = None
+_subscribed = threading.Event()
+_stats = Counter()
+
+
+def _local_cache():
+    """This process's L1, starting its invalidation subscriber on first use (and after a fork)"""
+    global _local, _local_pid
+    if _local_pid != os.getpid():
+        _local = LocalCache(current_app.config['CACHE_L1_MAX_ENTRIES'])
+        _local_pid = os.getpid()
+        _subscribed.clear()
+        threading.Thread(
+            target=_listen, args=(current_app.redis, _local), name='cache-invalidation', daemon=True
+        ).start()
+    return _local
+
+
+def _listen(redis, local):
+    """Drop L1 entries for every published invalidation; reconnect with backoff on errors"""
+    delay = 1
+    while True:
+        try:
+            pubsub = redis.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Anything published while disconnected was missed
+            local.clear()
+            _subscribed.set()
+            delay = 1
+            for message in pubsub.listen():
+                if message['type'] == 'message':
+                    local.invalidate(message['data'].decode().split('\n'))
+        except Exception:
+            pass
+        _subscribed.clear()
+        local.clear()
+        time.sleep(delay)
+        delay = min(delay * 2, 30)
+
+
+def cache_stats():
+    """Per-tier hit/miss counters for this process"""
+    return {
+        'l1': {'hits': _stats['l1_hits'], 'misses': _stats['l1_misses'], 'entries': len(_local or ())},
+        'l2': {'hits': _stats['l2_hits'], 'stale_hits': _stats['l2_stale_hits'], 'misses': _stats['l2_misses']},
+        'l1_subscribed': _subscribed.is_set()
+    }
+
+
+def cache_key(namespace, per_user=False):
+    """Cache key for the current request"""
+    role = get_jwt().get('role', 'anon')
+    parts = ['cache', namespace, role]
+    if per_user:
+        parts.append(str(g.user_id))
+    args = sorted(request.args.items(multi=True))
+    parts.append(hashlib.sha1(urlencode(args).encode()).hexdigest()[:16] if args else '-')
+    return ':'.join(parts)
+
+
+def body_etag(body):
+    """Strong ETag value for a response body"""
+    return hashlib.sha256(body).hexdigest()[:32]
+
+
+def _encode(status, fresh_until, etag, body):
+    return f'{status} {fresh_until:.3f} {etag}\n'.encode() + body
+
+
+def _decode(raw):
+    header, body = raw.split(b'\n', 1)
+    status, fresh_until, *etag = header.split(b' ')
+    # Entries written before ETags were stored have a two-field header
+    return int(status), float(fresh_until), etag[0].decode() if etag else body_etag(body), body
+
+
+def _respond(status, body, etag):
+    response = Response(body, status=status, mimetype='application/json')
+    if status == 200:
+        response.set_etag(etag)
+    return response
+
+
+def conditional(fn):
+    """Give a view's 200 responses a strong ETag and answer a matching If-None-Match with 304.
+
+    Views wrapped by @cached already carry the stored ETag; others are hashed.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        response = make_response(fn(*args, **kwargs))
+        if response.status_code != 200:
+            return response
+        if 'ETag' not in response.headers:
+            response.set_etag(body_etag(response.get_data()))
+        # Clients may keep the body but must revalidate before reusing it
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+    return wrapper
+
+
+def _local_expiry(fresh_until):
+    return min(fresh_until, time.time() + current_app.config['CACHE_L1_TTL'])
+
+
+def cached(namespace, ttl=None, stale_ttl=None, negative_ttl=None, per_user=False, tags=None):
+    """Cache a JSON view's 200 responses (and 404s when negative_ttl is set).
+
+    ttl defaults to CACHE_DEFAULT_TIMEOUT and stale_ttl to ttl. tags is an
+    optional callable returning extra tags for the current request. Apply below
+    the auth decorator so the role claim is available. Redis errors bypass the
+    cache. Responses are also @conditional, using the ETag stored with the entry.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            redis = current_app.redis
+            fresh_for = ttl or current_app.config['CACHE_DEFAULT_TIMEOUT']
+            stale_for = fresh_for if stale_ttl is None else stale_ttl
+            key = cache_key(namespace, per_user)
+            entry_tags = (namespace, *(tags() if tags else ()))
+            local = _local_cache()
+            use_local = _subscribed.is_set()
+            if use_local:
+                hit = local.get(key)
+                if hit is not None:
+                    _stats['l1_hits'] += 1
+                    return _respond(*hit)
+                _stats['l1_misses'] += 1
+            try:
+                # Generations are read before the view runs, so an invalidation during it is detected
+                raw, *generations = redis.mget([key, *(_tag_generation(tag) for tag in entry_tags)])
+            except Exception:
+                return fn(*args, **kwargs)
+
+            lock_key = f'{key}:lock'
+            lock_token = uuid4().hex
+            acquired = False
+            if raw is not None:
+                status, fresh_until, etag, body = _decode(raw)
+                if time.time() < fresh_until:
+                    _stats['l2_hits'] += 1
+                    if use_local:
+                        local.set(key, _local_expiry(fresh_until), status, body, etag, entry_tags)
+                    return _respond(status, body, etag)
+                _stats['l2_stale_hits'] += 1
+                # Stale: only the lock holder recomputes, everyone else serves the old body
+                try:
+                    if not redis.set(lock_key, lock_token, nx=True, px=LOCK_TIMEOUT_MS):
+                        return _respond(status, body, etag)
+                    acquired = True
+                except Exception:
+                    return _respond(status, body, etag)
+            else:
+                _stats['l2_misses'] += 1
+                try:
+                    acquired = redis.set(lock_key, lock_token, nx=True, px=LOCK_TIMEOUT_MS)
+                    deadline = time.monotonic() + COLD_WAIT
+                    while not acquired and time.monotonic() < deadline:
+                        time.sleep(COLD_POLL)
+                        raw = redis.get(key)
+                        if raw is not None:
+                            status, _, etag, body = _decode(raw)
+                            return _respond(status, body, etag)
+                        acquired = redis.set(lock_key, lock_token, nx=True, px=LOCK_TIMEOUT_MS)
+                except Exception:
+                    return fn(*args, **kwargs)
+
+            # Computed on the primary: a lagging replica must not be cached past an invalidation
+            with primary():
+                response = make_response(fn(*args, **kwargs))
+            try:
+                if response.status_code == 200:
+                    lifetime = fresh_for
+                elif response.status_code == 404 and negative_ttl:
+                    lifetime = negative_ttl
+                else:
+                    lifetime = None
+                pipe = redis.pipeline()
+                if lifetime:
+                    body = response.get_data()
+                    etag = body_etag(body)
+                    if response.status_code == 200:
+                        response.set_etag(etag)
+                    fresh_until = time.time() + lifetime
+                    _script('cache_store', _STORE_SCRIPT)(
+                        keys=[key, *(_tag_generation(tag) for tag in entry_tags), *(_tag_set(tag) for tag in entry_tags)],
+                        args=[lifetime + stale_for, _encode(response.status_code, fresh_until, etag, body),
+                              *(generation or b'' for generation in generations)],
+                        client=pipe
+                    )
+                    # Set before the store runs: an invalidation published after it also reaches this entry
+                    if use_local:
+                        local.set(key, _local_expiry(fresh_until), response.status_code, body, etag, entry_tags)
+                if acquired:
+                    # After COLD_WAIT we compute without the lock; never drop one another worker holds
+                    _script('cache_release_lock', _RELEASE_LOCK_SCRIPT)(keys=[lock_key], args=[lock_token], client=pipe)
+                results = pipe.execute()
+                if lifetime and not results[0] and use_local:
+                    local.discard(key)
+            except Exception:
+                if lifetime and use_local:
+                    local.discard(key)
+            return response
+        return conditional(wrapper)
+    return decorator
+
+
+def _script(name, source):
+    """Lua script registered once per app"""
+    script = current_app.extensions.get(name)
+    if script is None:
+        script = current_app.redis.register_script(source)
+        current_app.extensions[name] = script
+    return script
+
+
+def invalidate(*tags):
+    """Drop every cached entry registered under any of the given tags, in both tiers"""
+    if not tags:
+        return
+    if _local is not None and _local_pid == os.getpid():
+        _local.invalidate(tags)
+    try:
+        redis = current_app.redis
+        script = _script('cache_invalidate', _INVALIDATE_SCRIPT)
+        tag_list = sorted(tags)
+        pipe = redis.pipeline()
+        script(keys=[_tag_set(tag) for tag in tag_list], client=pipe)
+        for tag in tag_list:
+            pipe.incr(_tag_generation(tag))
+            pipe.expire(_tag_generation(tag), GENERATION_TTL)
+        pipe.publish(INVALIDATION_CHANNEL, '\n'.join(tag_list))
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def _collect_tags(session, flush_context):
+    # after_flush: ids are assigned but new/dirty/deleted still describe this flush
+    tags = session.info.setdefault('cache_tags', set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        tags_for = TAGS_BY_MODEL.get(type(obj))
+        if tags_for and (obj in session.new or obj in session.deleted or session.is_modified(obj)):
+            tags.update(tags_for(obj))
+
+
+def _invalidate_committed(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags and has_app_context():
+        invalidate(*tags)
+
+
+def _discard_tags(session):
+    session.info.pop('cache_tags', None)
+
+
+def register_cache_invalidation():
+    """Install the session hooks that invalidate cache tags after each commit"""
+    if not event.contains(Session, 'after_commit', _invalidate_committed):
+        event.listen(Session, 'after_flush', _collect_tags)
+        event.listen(Session, 'after_commit', _invalidate_committed)
+        event.listen(Session, 'after_rollback', _discard_tags)
@@ -1,22 +1,66 @@
-from celery import Celery
+from celery import Celery, Task
 from celery.schedules import crontab
+from celery.signals import worker_process_init, beat_init
+from flask import current_app
 from datetime import datetime, date, timedelta
 import json
-import smtplib
-from email.mime.text import MIMEText
-import requests
+from itertools import groupby
+from operator import itemgetter
+from jinja2 import Environment
 
 # Celery instance (configured later by init_celery)
 import os
 import sys
 # Ensure backend directory is on sys.path for worker subprocesses
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from notifications import WebhookDispatcher, SMTPMailer, summarize
+
 _default_redis = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
-celery = Celery('hms', broker=_default_redis, backend=_default_redis)
+
+# Flask app shared by every task run in this process (one app and engine per worker)
+_flask_app = None
+
+
+def get_flask_app():
+    """Return the process-wide Flask app, creating it on first use"""
+    global _flask_app
+    if _flask_app is None:
+        from app import create_app  # local import to avoid cycles
+        _flask_app = create_app()
+    return _flask_app
+
+
+@worker_process_init.connect
+def _init_worker_process(**kwargs):
+    """Build the app once per forked pool process, not per task"""
+    if _flask_app is not None:
+        # Connections inherited from the parent must not be shared across fork
+        from models import db
+        with _flask_app.app_context():
+            db.engine.dispose(close=False)
+    get_flask_app()
+
+
+@beat_init.connect
+def _init_beat(**kwargs):
+    """Beat needs the app so init_celery installs the schedule"""
+    get_flask_app()
+
+
+class ContextTask(Task):
+    def __call__(self, *args, **kwargs):
+        with get_flask_app().app_context():
+            return self.run(*args, **kwargs)
+
+
+celery = Celery('hms', broker=_default_redis, backend=_default_redis, task_cls=ContextTask)
 
 
 def init_celery(app):
     """Bind Celery to the Flask app and configure beat schedule."""
+    global _flask_app
+    if _flask_app is None:
+        _flask_app = app
     celery.conf.update(
         broker_url=app.config['CELERY_BROKER_URL'],
         result_backend=app.config['CELERY_RESULT_BACKEND'],
@@ -30,152 +74,207 @@ def init_celery(app):
                 'task': 'celery_tasks.send_monthly_reports',
                 'schedule': crontab(hour=8, minute=0, day_of_month=1),
             },
+            'reconcile-stats': {
+                'task': 'celery_tasks.reconcile_stats',
+                'schedule': crontab(hour=0, minute=5),  # just after midnight so past dates drop out
+            },
         },
     )
-
-    class ContextTask(celery.Task):
-        def __call__(self, *args, **kwargs):
-            from app import create_app  # local import to avoid cycles
-            flask_app = create_app()
-            with flask_app.app_context():
-                return self.run(*args, **kwargs)
-
-    celery.Task = ContextTask
     return celery
 
 
-def _send_google_chat(webhook_url: str, text: str) -> None:
-    if not webhook_url:
-        return
-    try:
-        requests.post(webhook_url, json={"text": text}, timeout=10)
-    except Exception:
-        pass
-
-
-def _send_email(smtp_server, port, username, password, to_email, subject, html_body):
-    if not (smtp_server and username and password and to_email):
-        return
-    msg = MIMEText(html_body, 'html')
-    msg['Subject'] = subject
-    msg['From'] = username
-    msg['To'] = to_email
-    try:
-        server = smtplib.SMTP(smtp_server, port)
-        server.starttls()
-        server.login(username, password)
-        server.sendmail(username, [to_email], msg.as_string())
-        server.quit()
-    except Exception:
-        pass
+# Compiled once per process; autoescaping keeps patient data from injecting HTML
+_REPORT_TEMPLATE = Environment(autoescape=True).from_string("""
+<html>
+<body>
+    <h2>Monthly Activity Report</h2>
+    <p><strong>Doctor:</strong> {{ doctor_name }}</p>
+    <p><strong>Period:</strong> {{ period_start }} to {{ period_end }}</p>
+    <ul>
+        <li>Total Appointments: {{ total }}</li>
+        <li>Completed: {{ completed }}</li>
+        <li>Cancelled: {{ cancelled }}</li>
+    </ul>
+    <table border="1" cellpadding="6" cellspacing="0">
+        <tr><th>Date</th><th>Patient</th><th>Status</th><th>Diagnosis</th></tr>
+        {%- for _, appointment_date, status, patient_name, diagnosis in rows %}
+        <tr><td>{{ appointment_date }}</td><td>{{ patient_name }}</td><td>{{ status }}</td><td>{{ diagnosis or '—' }}</td></tr>
+        {%- endfor %}
+    </table>
+</body>
+</html>
+""")
 
 
 @celery.task(name='celery_tasks.send_daily_reminders')
 def send_daily_reminders():
-    """Send reminders to patients with appointments today via Google Chat or email."""
-    from app import create_app
-    app = create_app()
-    with app.app_context():
-        from models import Appointment
-        today = date.today()
-        appointments = Appointment.query.filter(
-            Appointment.appointment_date == today,
-            Appointment.status == 'Booked'
-        ).all()
-        webhook = app.config.get('GOOGLE_CHAT_WEBHOOK_URL')
-        for apt in appointments:
-            patient = apt.patient
-            message = (
-                f"Reminder: {patient.name}, your appointment with Dr. {apt.doctor.name} "
-                f"is today at {apt.appointment_time.strftime('%H:%M')}"
-            )
-            _send_google_chat(webhook, message)
-        return f"Sent {len(appointments)} reminders"
+    """Send reminders to patients with appointments today via Google Chat.
+
+    Returns delivery counts plus the appointment id and error of every failed message.
+    """
+    from models import Appointment
+    from models.queries import appointment_query
+    today = date.today()
+    appointments = appointment_query().filter(
+        Appointment.appointment_date == today,
+        Appointment.status == 'Booked'
+    ).all()
+    webhook = current_app.config.get('GOOGLE_CHAT_WEBHOOK_URL')
+    if not webhook:
+        return summarize([])
+    messages = [(apt.id, {"text": (
+        f"Reminder: {apt.patient.name}, your appointment with Dr. {apt.doctor.name} "
+        f"is today at {apt.appointment_time.strftime('%H:%M')}"
+    )}) for apt in appointments]
+    dispatcher = WebhookDispatcher(
+        max_workers=current_app.config['WEBHOOK_MAX_WORKERS'],
+        rate_per_endpoint=current_app.config['WEBHOOK_RATE_LIMIT'],
+        max_retries=current_app.config['WEBHOOK_MAX_RETRIES'],
+        timeout=current_app.config['WEBHOOK_TIMEOUT'],
+        max_retry_after=current_app.config['WEBHOOK_MAX_RETRY_AFTER']
+    )
+    try:
+        return summarize(dispatcher.send_all(webhook, messages))
+    finally:
+        dispatcher.close()
 
 
 @celery.task(name='celery_tasks.send_monthly_reports')
 def send_monthly_reports():
-    """Generate monthly activity report for each doctor and email it if SMTP is configured."""
-    from app import create_app
-    app = create_app()
-    with app.app_context():
-        from models import Doctor, Appointment
-
-        today = date.today()
-        if today.month == 1:
-            first_day_last_month = date(today.year - 1, 12, 1)
-        else:
-            first_day_last_month = date(today.year, today.month - 1, 1)
-        last_day_last_month = date(today.year, today.month, 1) - timedelta(days=1)
-
-        doctors = Doctor.query.all()
-        for doctor in doctors:
-            appointments = Appointment.query.filter(
-                Appointment.doctor_id == doctor.id,
-                Appointment.appointment_date >= first_day_last_month,
-                Appointment.appointment_date <= last_day_last_month
-            ).all()
-
-            report_html = f"""
-            <html>
-            <body>
-                <h2>Monthly Activity Report</h2>
-                <p><strong>Doctor:</strong> {doctor.name}</p>
-                <p><strong>Period:</strong> {first_day_last_month} to {last_day_last_month}</p>
-                <ul>
-                    <li>Total Appointments: {len(appointments)}</li>
-                    <li>Completed: {len([a for a in appointments if a.status == 'Completed'])}</li>
-                    <li>Cancelled: {len([a for a in appointments if a.status == 'Cancelled'])}</li>
-                </ul>
-                <table border="1" cellpadding="6" cellspacing="0">
-                    <tr><th>Date</th><th>Patient</th><th>Status</th><th>Diagnosis</th></tr>
-            """
-
-            for apt in appointments:
-                diagnosis = apt.treatment.diagnosis if apt.treatment else '—'
-                report_html += f"<tr><td>{apt.appointment_date}</td><td>{apt.patient.name}</td><td>{apt.status}</td><td>{diagnosis}</td></tr>"
-            report_html += "</table></body></html>"
-
-            _send_email(
-                app.config.get('MAIL_SERVER'),
-                app.config.get('MAIL_PORT'),
-                app.config.get('MAIL_USERNAME'),
-                app.config.get('MAIL_PASSWORD'),
-                doctor.user.email if doctor.user and doctor.user.email else None,
-                "Monthly Activity Report",
-                report_html,
+    """Generate monthly activity report for each doctor and email it if SMTP is configured.
+
+    Returns the number of reports generated and per-recipient delivery results.
+    """
+    from models import db, User, Doctor, Patient, Appointment, Treatment
+    from sqlalchemy import func, case
+
+    today = date.today()
+    if today.month == 1:
+        first_day_last_month = date(today.year - 1, 12, 1)
+    else:
+        first_day_last_month = date(today.year, today.month - 1, 1)
+    last_day_last_month = date(today.year, today.month, 1) - timedelta(days=1)
+    in_period = (
+        Appointment.appointment_date >= first_day_last_month,
+        Appointment.appointment_date <= last_day_last_month
+    )
+
+    # Per-doctor totals for the whole month in one grouped query
+    totals = {
+        doctor_id: (total, completed or 0, cancelled or 0)
+        for doctor_id, total, completed, cancelled in db.session.query(
+            Appointment.doctor_id,
+            func.count(Appointment.id),
+            func.sum(case((Appointment.status == 'Completed', 1), else_=0)),
+            func.sum(case((Appointment.status == 'Cancelled', 1), else_=0))
+        ).filter(*in_period).group_by(Appointment.doctor_id)
+    }
+
+    doctors = db.session.query(Doctor.id, Doctor.name, User.email).join(
+        User, Doctor.user_id == User.id
+    ).order_by(Doctor.id).all()
+
+    # Detail rows for every doctor, streamed in doctor order and consumed one doctor at a time
+    detail_rows = db.session.query(
+        Appointment.doctor_id,
+        Appointment.appointment_date,
+        Appointment.status,
+        Patient.name,
+        Treatment.diagnosis
+    ).join(Patient, Appointment.patient_id == Patient.id).outerjoin(
+        Treatment, Treatment.appointment_id == Appointment.id
+    ).filter(*in_period).order_by(
+        Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time
+    ).execution_options(yield_per=1000)
+
+    config = current_app.config
+    mailer = None
+    if config.get('MAIL_SERVER') and config.get('MAIL_USERNAME') and config.get('MAIL_PASSWORD'):
+        mailer = SMTPMailer(
+            config['MAIL_SERVER'],
+            config['MAIL_PORT'],
+            config['MAIL_USERNAME'],
+            config['MAIL_PASSWORD'],
+            use_tls=config.get('MAIL_USE_TLS', True),
+            max_connections=config['MAIL_MAX_CONNECTIONS']
+        )
+
+    def reports():
+        groups = groupby(detail_rows, key=itemgetter(0))
+        group = next(groups, None)
+        for doctor_id, doctor_name, email in doctors:
+            # Both sides are ordered by doctor id, so the next group is this doctor's or a later one
+            matched = group is not None and group[0] == doctor_id
+            total, completed, cancelled = totals.get(doctor_id, (0, 0, 0))
+            report_html = _REPORT_TEMPLATE.render(
+                doctor_name=doctor_name,
+                period_start=first_day_last_month,
+                period_end=last_day_last_month,
+                total=total,
+                completed=completed,
+                cancelled=cancelled,
+                rows=group[1] if matched else ()
             )
-        return f"Sent {len(doctors)} monthly reports"
-
-
-@celery.task(name='celery_tasks.export_patient_treatments')
-def export_patient_treatments(patient_id: int):
-    """Export patient's treatment history as CSV and return content as string."""
-    from app import create_app
-    import csv, io
-    app = create_app()
-    with app.app_context():
-        from models import Patient, Appointment
-        patient = Patient.query.get(patient_id)
-        if not patient:
-            return ''
-        appointments = Appointment.query.filter(
-            Appointment.patient_id == patient_id,
-            Appointment.status == 'Completed'
-        ).all()
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow(['Patient ID', 'Patient Name', 'Doctor', 'Date', 'Diagnosis', 'Prescription', 'Next Visit'])
-        for apt in appointments:
-            if apt.treatment:
-                writer.writerow([
-                    patient.id,
-                    patient.name,
-                    apt.doctor.name,
-                    apt.appointment_date.isoformat(),
-                    apt.treatment.diagnosis or '',
-                    apt.treatment.prescription or '',
-                    apt.treatment.next_visit.isoformat() if apt.treatment.next_visit else ''
-                ])
-        return output.getvalue()
+            if matched:
+                group = next(groups, None)
+            yield doctor_id, email, "Monthly Activity Report", report_html
 
+    results = []
+    if mailer:
+        # send_all pulls reports lazily, so each one is mailed while the next renders
+        try:
+            results = mailer.send_all(reports())
+        finally:
+            mailer.close()
+    return {'reports': len(doctors), **summarize(results)}
+
+
+@celery.task(bind=True, name='celery_tasks.export_patient_treatments')
+def export_patient_treatments(self, patient_id: int):
+    """Export patient's treatment history as a gzip CSV artifact and return its metadata."""
+    from models import Patient
+    from exports import iter_treatment_csv, gzip_chunks
+    from artifacts import save_artifact, purge_expired_artifacts
+    patient = Patient.query.get(patient_id)
+    if not patient:
+        return None
+    purge_expired_artifacts()
+    return save_artifact(
+        self.request.id,
+        gzip_chunks(iter_treatment_csv(patient)),
+        patient_id=patient_id,
+        filename='treatment_history.csv',
+        encoding='gzip'
+    )
+
+
+@celery.task(bind=True, name='celery_tasks.import_accounts')
+def import_accounts(self, kind: str, fmt: str, upload_id: str):
+    """Run a bulk import from an uploaded artifact; the error report is stored as import-<task id>."""
+    from artifacts import artifact_path, save_artifact, delete_artifact, purge_expired_artifacts
+    from imports import run_import, report_chunks
+    purge_expired_artifacts()
+    try:
+        with open(artifact_path(upload_id), encoding='utf-8-sig', newline='') as lines:
+            result = run_import(kind, lines, fmt)
+    finally:
+        delete_artifact(upload_id)
+    report_id = None
+    if result['errors']:
+        report_id = f'import-{self.request.id}'
+        save_artifact(report_id, report_chunks(result['errors']), filename=f'{kind}_import_errors.csv')
+    return {'kind': kind, 'created': result['created'], 'failed': result['failed'], 'report_id': report_id}
+
+
+@celery.task(name='celery_tasks.reconcile_stats')
+def reconcile_stats():
+    """Rebuild the dashboard stat counters from the source tables."""
+    from models import db
+    from stats import rebuild_stats
+    try:
+        rows = rebuild_stats(db.session.connection())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'counters': rows}
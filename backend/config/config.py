@@ -3,27 +3,64 @@ from datetime import timedelta
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///hospital.db'
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///hospital.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Optional read replica for GET handlers (see models/routing.py)
+    SQLALCHEMY_BINDS = {'replica': os.environ['REPLICA_DATABASE_URL']} if os.environ.get('REPLICA_DATABASE_URL') else {}
+    REPLICA_READ_YOUR_WRITES = int(os.environ.get('REPLICA_READ_YOUR_WRITES', 5))  # seconds a writer reads from the primary
+    
+    # Engine profile (see config/engine_profiles.py); defaults to the URL's backend
+    DB_PROFILE = os.environ.get('DB_PROFILE')
+    DB_BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+    DB_SQLITE_SYNCHRONOUS = os.environ.get('DB_SQLITE_SYNCHRONOUS', 'NORMAL')
+    DB_SQLITE_CACHE_KB = int(os.environ.get('DB_SQLITE_CACHE_KB', 64 * 1024))
+    DB_SQLITE_MMAP_SIZE = int(os.environ.get('DB_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))  # seconds to wait for a pooled connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))
+    DB_IDLE_TX_TIMEOUT_MS = int(os.environ.get('DB_IDLE_TX_TIMEOUT_MS', 60000))
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-key-change-in-production'
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=24)
-    
+
+    # Password hashing (passwords.py); existing hashes are upgraded on login
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 32))  # waiting hashes before logins get 503
+
     # Redis Configuration
     REDIS_URL = os.environ.get('REDIS_URL') or 'redis://localhost:6379/0'
     CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_L1_MAX_ENTRIES = int(os.environ.get('CACHE_L1_MAX_ENTRIES', 1024))  # in-process entries per worker
+    CACHE_L1_TTL = int(os.environ.get('CACHE_L1_TTL', 30))  # seconds; caps how long L1 trusts an entry
     
     # Celery Configuration
     CELERY_BROKER_URL = REDIS_URL
     CELERY_RESULT_BACKEND = REDIS_URL
     CELERY_TIMEZONE = 'UTC'
     
+    # Bulk account import (imports.py)
+    IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))  # rows per transaction
+    IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', os.cpu_count() or 2))
+    
+    # Async export artifacts (shared by web and worker processes)
+    EXPORT_DIR = os.environ.get('EXPORT_DIR')  # defaults to <instance>/exports
+    EXPORT_TTL = int(os.environ.get('EXPORT_TTL', 24 * 3600))  # seconds
+    
     # Email Configuration (for monthly reports)
     MAIL_SERVER = 'smtp.gmail.com'
     MAIL_PORT = 587
     MAIL_USE_TLS = True
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_MAX_CONNECTIONS = int(os.environ.get('MAIL_MAX_CONNECTIONS', 4))  # parallel SMTP sessions per batch
 
     # Google Chat Webhook (optional for notifications)
     GOOGLE_CHAT_WEBHOOK_URL = os.environ.get('GOOGLE_CHAT_WEBHOOK_URL')
+    WEBHOOK_MAX_WORKERS = int(os.environ.get('WEBHOOK_MAX_WORKERS', 8))
+    WEBHOOK_RATE_LIMIT = float(os.environ.get('WEBHOOK_RATE_LIMIT', 10))  # messages/second per endpoint
+    WEBHOOK_MAX_RETRIES = int(os.environ.get('WEBHOOK_MAX_RETRIES', 3))
+    WEBHOOK_TIMEOUT = int(os.environ.get('WEBHOOK_TIMEOUT', 5))
+    WEBHOOK_MAX_RETRY_AFTER = float(os.environ.get('WEBHOOK_MAX_RETRY_AFTER', 30))  # longer Retry-After fails the message
 
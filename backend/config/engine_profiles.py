@@ -0,0 +1,91 @@
+"""Named SQLAlchemy engine profiles
+
+Each engine's profile is DB_PROFILE if set, otherwise the backend of that
+engine's URL ('sqlite', 'postgresql'), so a replica in SQLALCHEMY_BINDS is tuned
+for its own database. 'default' applies no tuning.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def _sqlite_options(config):
+    # pysqlite's own busy handler; the PRAGMA below covers connections it didn't open
+    return {'connect_args': {'timeout': config['DB_BUSY_TIMEOUT_MS'] / 1000}}
+
+
+def _sqlite_connect(config):
+    pragmas = [
+        'PRAGMA journal_mode=WAL',  # readers no longer block the writer
+        f"PRAGMA synchronous={config['DB_SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['DB_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA cache_size=-{int(config['DB_SQLITE_CACHE_KB'])}",  # negative = KiB
+        f"PRAGMA mmap_size={int(config['DB_SQLITE_MMAP_SIZE'])}",
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def _postgresql_options(config):
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+        'connect_args': {
+            'options': f"-c statement_timeout={int(config['DB_STATEMENT_TIMEOUT_MS'])}"
+                       f" -c idle_in_transaction_session_timeout={int(config['DB_IDLE_TX_TIMEOUT_MS'])}",
+            'application_name': 'hms',
+        },
+    }
+
+
+# name -> (engine options factory, connect listener factory or None)
+ENGINE_PROFILES = {
+    'default': (lambda config: {}, None),
+    'sqlite': (_sqlite_options, _sqlite_connect),
+    'postgresql': (_postgresql_options, None),
+}
+
+
+def profile_name(config, url=None):
+    """Profile for the database at url (default SQLALCHEMY_DATABASE_URI)"""
+    url = url or config['SQLALCHEMY_DATABASE_URI']
+    name = config.get('DB_PROFILE') or make_url(url).get_backend_name()
+    if config.get('DB_PROFILE') and name not in ENGINE_PROFILES:
+        raise ValueError(f'Unknown DB_PROFILE {name!r}; expected one of {sorted(ENGINE_PROFILES)}')
+    return name if name in ENGINE_PROFILES else 'default'
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the primary's profile; explicit settings win"""
+    options, _ = ENGINE_PROFILES[profile_name(config)]
+    return {**options(config), **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+
+def bind_options(config):
+    """SQLALCHEMY_BINDS with each bind's profile options; options given for a bind win.
+
+    Flask-SQLAlchemy applies SQLALCHEMY_ENGINE_OPTIONS to the primary only.
+    """
+    binds = {}
+    for key, bind in config.get('SQLALCHEMY_BINDS', {}).items():
+        bind = {'url': bind} if isinstance(bind, str) else dict(bind)
+        options, _ = ENGINE_PROFILES[profile_name(config, bind['url'])]
+        binds[key] = {**options(config), **bind}
+    return binds
+
+
+def install_engine_events(engine, config):
+    """Attach the per-connection setup of the profile for engine's database"""
+    _, connect = ENGINE_PROFILES[profile_name(config, engine.url)]
+    if connect is not None:
+        event.listen(engine, 'connect', connect(config))
@@ -0,0 +1,226 @@
+"""In-process snapshot of the patient-facing doctor directory
+
+patient.get_doctors is answered from memory. Writers call mark_doctor_changed()
+after committing; that bumps a version counter in Redis and records the doctor
+id, so every worker reloads just the changed doctors on its next read and all
+workers converge on the same version.
+"""
+from flask import current_app
+from sqlalchemy.orm import joinedload
+from bisect import bisect_left
+from datetime import date, timedelta
+import threading
+import time
+
+from models import User, Doctor
+from models.queries import availability_by_doctor
+from models.routing import primary
+
+VERSION_KEY = 'directory:version'
+CHANGES_KEY = 'directory:changes'  # sorted set: doctor id scored by the version that changed it
+MAX_TRACKED_CHANGES = 1000
+# Without Redis the version can't be checked; rebuild at least this often (seconds)
+MAX_UNVERSIONED_AGE = 60
+
+# Bumps the version and logs the doctor under it in one step, so a reader that
+# sees the new version always finds its change log entry
+_MARK_CHANGED_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], version, ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -tonumber(ARGV[2]) - 1)
+return version
+"""
+
+
+class DoctorRecord:
+    __slots__ = (
+        'id', 'name', 'specialization', 'department_id', 'department_name',
+        'phone', 'experience_years', 'qualification', 'availability'
+    )
+
+    def __init__(self, doctor, availability):
+        self.id = doctor.id
+        self.name = doctor.name
+        self.specialization = doctor.specialization
+        self.department_id = doctor.department_id
+        self.department_name = doctor.department.name
+        self.phone = doctor.phone
+        self.experience_years = doctor.experience_years
+        self.qualification = doctor.qualification
+        self.availability = tuple(
+            (avail.date.isoformat(), avail.start_time.strftime('%H:%M'), avail.end_time.strftime('%H:%M'))
+            for avail in availability
+        )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'specialization': self.specialization,
+            'department_id': self.department_id,
+            'department_name': self.department_name,
+            'phone': self.phone,
+            'experience_years': self.experience_years,
+            'qualification': self.qualification,
+            'availability': [{
+                'date': avail_date,
+                'start_time': start_time,
+                'end_time': end_time
+            } for avail_date, start_time, end_time in self.availability]
+        }
+
+
+class DirectorySnapshot:
+    """Immutable set of active doctors with lookup indexes; replaced, never mutated"""
+
+    def __init__(self, records, version, window_start):
+        self.records = records
+        self.version = version
+        self.window_start = window_start
+        self.built_at = time.monotonic()
+        self.by_department = {}
+        self.by_specialization = {}
+        name_words = []
+        for record in records.values():
+            self.by_department.setdefault(record.department_id, set()).add(record.id)
+            self.by_specialization.setdefault(record.specialization.lower(), set()).add(record.id)
+            for word in record.name.lower().split():
+                name_words.append((word, record.id))
+        # Sorted (word, id) pairs; a prefix lookup is a bisect plus a short walk
+        self.name_words = sorted(name_words)
+
+    def _name_prefix(self, prefix):
+        ids = set()
+        i = bisect_left(self.name_words, (prefix,))
+        while i < len(self.name_words) and self.name_words[i][0].startswith(prefix):
+            ids.add(self.name_words[i][1])
+            i += 1
+        return ids
+
+    def _specialization_contains(self, term):
+        ids = set()
+        for specialization, spec_ids in self.by_specialization.items():
+            if term in specialization:
+                ids |= spec_ids
+        return ids
+
+    def filter(self, specialization=None, department_id=None, search=None):
+        """Doctors matching every given filter, ordered by id.
+
+        specialization matches by substring; search matches a prefix of any
+        word of the doctor's name, or a substring of the specialization.
+        """
+        ids = None
+        if department_id is not None:
+            ids = set(self.by_department.get(department_id, ()))
+        if specialization:
+            matched = self._specialization_contains(specialization.lower())
+            ids = matched if ids is None else ids & matched
+        if search:
+            term = search.lower().strip()
+            matched = self._name_prefix(term) | self._specialization_contains(term)
+            # Multi-word searches also match the full name as a prefix
+            if ' ' in term:
+                matched |= {r.id for r in self.records.values() if r.name.lower().startswith(term)}
+            ids = matched if ids is None else ids & matched
+        if ids is None:
+            ids = self.records.keys()
+        return [self.records[doctor_id] for doctor_id in sorted(ids)]
+
+
+def _load_records(doctor_ids=None):
+    """Load active doctors (all, or only doctor_ids) with department and 7-day availability"""
+    today = date.today()
+    query = Doctor.query.join(Doctor.user).filter(User.is_active == True).options(
+        joinedload(Doctor.department)
+    )
+    if doctor_ids is not None:
+        query = query.filter(Doctor.id.in_(doctor_ids))
+    # The snapshot is stamped with the current version, so it must not see a lagging replica
+    with primary():
+        doctors = query.all()
+        availability = availability_by_doctor([doc.id for doc in doctors], today, today + timedelta(days=7))
+    return {doc.id: DoctorRecord(doc, availability[doc.id]) for doc in doctors}
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _redis_version():
+    try:
+        return int(current_app.redis.get(VERSION_KEY) or 0)
+    except Exception:
+        return None
+
+
+def get_snapshot():
+    """Current directory snapshot, refreshed if another worker (or a new day) made it stale"""
+    global _snapshot
+    version = _redis_version()
+    snapshot = _snapshot
+    if snapshot is not None and snapshot.window_start == date.today():
+        if version is not None and version == snapshot.version:
+            return snapshot
+        if version is None and time.monotonic() - snapshot.built_at < MAX_UNVERSIONED_AGE:
+            return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is not None and version is not None and snapshot.version == version \
+                and snapshot.window_start == date.today():
+            return snapshot
+        changed = None
+        if snapshot is not None and version is not None and snapshot.window_start == date.today():
+            changed = _changed_since(snapshot.version, version)
+        if changed is None:
+            _snapshot = DirectorySnapshot(_load_records(), version or 0, date.today())
+        else:
+            records = dict(snapshot.records)
+            for doctor_id in changed:
+                records.pop(doctor_id, None)
+            records.update(_load_records(changed))
+            _snapshot = DirectorySnapshot(records, version, snapshot.window_start)
+        return _snapshot
+
+
+def _changed_since(old_version, new_version):
+    """Doctor ids changed after old_version, or None if the change log can't cover the gap"""
+    try:
+        entries = current_app.redis.zrangebyscore(CHANGES_KEY, f'({old_version}', new_version, withscores=True)
+        oldest = current_app.redis.zrange(CHANGES_KEY, 0, 0, withscores=True)
+    except Exception:
+        return None
+    # Entries older than the ones we need were trimmed: fall back to a full rebuild
+    if not oldest or oldest[0][1] > old_version + 1:
+        return None
+    return {int(member) for member, _ in entries}
+
+
+def mark_doctor_changed(doctor_id):
+    """Publish that a doctor's directory data changed; call after the commit"""
+    global _snapshot
+    try:
+        script = current_app.extensions.get('directory_mark_changed')
+        if script is None:
+            script = current_app.redis.register_script(_MARK_CHANGED_SCRIPT)
+            current_app.extensions['directory_mark_changed'] = script
+        script(keys=[VERSION_KEY, CHANGES_KEY], args=[doctor_id, MAX_TRACKED_CHANGES])
+    except Exception:
+        # Without Redis other workers pick the change up on their periodic rebuild
+        with _lock:
+            _snapshot = None
+
+
+def mark_directory_stale():
+    """Force every worker to rebuild the whole snapshot (after bulk changes)"""
+    global _snapshot
+    try:
+        pipe = current_app.redis.pipeline()
+        # Without a change log covering the new version, readers fall back to a full rebuild
+        pipe.delete(CHANGES_KEY)
+        pipe.incr(VERSION_KEY)
+        pipe.execute()
+    except Exception:
+        with _lock:
+            _snapshot = None
@@ -0,0 +1,67 @@
+"""Streaming CSV export of treatment history, shared by the API and Celery"""
+import csv
+import io
+import zlib
+
+from models import db, Doctor, Appointment, Treatment
+
+TREATMENT_CSV_HEADER = [
+    'Patient ID', 'Patient Name', 'Doctor Name', 'Appointment Date',
+    'Diagnosis', 'Treatment', 'Next Visit Suggested'
+]
+
+
+def treatment_rows(patient_id, chunk_size=500):
+    """Completed appointments with treatments as flat tuples, fetched chunk_size rows at a time"""
+    return db.session.query(
+        Doctor.name,
+        Appointment.appointment_date,
+        Treatment.diagnosis,
+        Treatment.prescription,
+        Treatment.next_visit
+    ).select_from(Appointment).join(
+        Treatment, Treatment.appointment_id == Appointment.id
+    ).join(
+        Doctor, Appointment.doctor_id == Doctor.id
+    ).filter(
+        Appointment.patient_id == patient_id,
+        Appointment.status == 'Completed'
+    ).order_by(
+        Appointment.appointment_date.desc(),
+        Appointment.appointment_time.desc(),
+        Appointment.id.desc()
+    ).execution_options(yield_per=chunk_size)
+
+
+def iter_treatment_csv(patient, chunk_size=500):
+    """Yield the CSV export as text chunks of about chunk_size rows each"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TREATMENT_CSV_HEADER)
+    rows = 0
+    for doctor_name, appointment_date, diagnosis, prescription, next_visit in treatment_rows(patient.id, chunk_size):
+        writer.writerow([
+            patient.id,
+            patient.name,
+            doctor_name,
+            appointment_date.isoformat(),
+            diagnosis or '',
+            prescription or '',
+            next_visit.isoformat() if next_visit else ''
+        ])
+        rows += 1
+        if rows % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Gzip-compress a stream of text chunks without buffering the whole output"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,116 @@
+"""Versioned schema migrations applied on top of db.create_all()
+
+db.create_all() only creates missing tables, so changes to existing tables
+(indexes, constraints) are recorded here and applied once per database.
+Each migration is a (version, description, function) entry; the function
+receives the session's connection and runs in the same transaction that
+records the version.
+"""
+from sqlalchemy import text, select, update, func
+from datetime import datetime
+
+from models import db, SchemaMigration, StatCounter, Appointment
+from models.search import fts_ddl
+from stats import rebuild_stats
+
+
+def _create_indexes(conn, *names):
+    """Create model-declared indexes by name if they don't exist yet"""
+    wanted = set(names)
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in wanted:
+                index.create(conn, checkfirst=True)
+                wanted.discard(index.name)
+    if wanted:
+        raise RuntimeError(f'Unknown indexes: {sorted(wanted)}')
+
+
+def _001_hot_path_indexes(conn):
+    _create_indexes(
+        conn,
+        'ix_appointments_doctor_slot',
+        'ix_appointments_patient_status',
+        'ix_appointments_date_status',
+        'ix_appointments_date_time',
+        'ix_appointments_created_at',
+        'ix_doctor_availability_doctor_date',
+        'ix_doctors_user_id',
+        'ix_patients_user_id',
+        'ix_treatments_appointment_id'
+    )
+
+
+def _002_booked_slot_unique(conn):
+    # Databases from before the index may already hold double bookings, which
+    # would make the unique index fail: keep the earliest booking of each slot
+    # and cancel the others
+    slot = (Appointment.doctor_id, Appointment.appointment_date, Appointment.appointment_time)
+    collisions = conn.execute(
+        select(*slot, func.min(Appointment.id))
+        .where(Appointment.status == 'Booked')
+        .group_by(*slot)
+        .having(func.count() > 1)
+    ).all()
+    for doctor_id, appointment_date, appointment_time, kept_id in collisions:
+        cancelled = conn.execute(
+            update(Appointment.__table__)
+            .where(
+                Appointment.doctor_id == doctor_id,
+                Appointment.appointment_date == appointment_date,
+                Appointment.appointment_time == appointment_time,
+                Appointment.status == 'Booked',
+                Appointment.id != kept_id
+            )
+            .values(status='Cancelled', updated_at=datetime.utcnow())
+            .returning(Appointment.id)
+        ).scalars().all()
+        print(f'Double booking of doctor {doctor_id} at {appointment_date} {appointment_time}: '
+              f'kept appointment {kept_id}, cancelled {sorted(cancelled)}')
+    _create_indexes(conn, 'ux_appointments_booked_slot')
+
+
+def _003_search_indexes(conn):
+    # FTS5 trigram shadow tables are SQLite-only; other databases keep ILIKE search
+    if conn.dialect.name != 'sqlite':
+        return
+    for statement in fts_ddl():
+        conn.execute(text(statement))
+
+
+def _004_stat_counters(conn):
+    # Table comes from create_all(); fill it from the existing rows
+    StatCounter.__table__.create(conn, checkfirst=True)
+    rebuild_stats(conn)
+
+
+def _005_doctor_department_index(conn):
+    _create_indexes(conn, 'ix_doctors_department_id')
+
+
+MIGRATIONS = [
+    (1, 'Indexes for appointment, availability and profile lookups', _001_hot_path_indexes),
+    (2, 'Unique booked appointment per doctor slot', _002_booked_slot_unique),
+    (3, 'FTS5 trigram search over doctors and patients', _003_search_indexes),
+    (4, 'Dashboard stat counters', _004_stat_counters),
+    (5, 'Index doctors by department', _005_doctor_department_index),
+]
+
+
+def run_migrations():
+    """Apply pending migrations in version order; returns the versions applied"""
+    applied = {m.version for m in SchemaMigration.query.all()}
+    done = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            migrate(db.session.connection())
+            db.session.add(SchemaMigration(version=version, description=description))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        done.append(version)
+        print(f'Applied migration {version}: {description}')
+    return done
@@ -1,7 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 
-db = SQLAlchemy()
+from models.routing import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -29,6 +31,11 @@ class Department(db.Model):
 
 class Doctor(db.Model):
     __tablename__ = 'doctors'
+    __table_args__ = (
+        db.Index('ix_doctors_user_id', 'user_id'),
+        # Department doctor lists and counts
+        db.Index('ix_doctors_department_id', 'department_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     department_id = db.Column(db.Integer, db.ForeignKey('departments.id'), nullable=False)
@@ -45,6 +52,9 @@ class Doctor(db.Model):
 
 class Patient(db.Model):
     __tablename__ = 'patients'
+    __table_args__ = (
+        db.Index('ix_patients_user_id', 'user_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
@@ -60,6 +70,9 @@ class Patient(db.Model):
 
 class DoctorAvailability(db.Model):
     __tablename__ = 'doctor_availability'
+    __table_args__ = (
+        db.Index('ix_doctor_availability_doctor_date', 'doctor_id', 'date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
@@ -70,6 +83,23 @@ class DoctorAvailability(db.Model):
 
 class Appointment(db.Model):
     __tablename__ = 'appointments'
+    __table_args__ = (
+        # Booking conflict check and doctor schedules
+        db.Index('ix_appointments_doctor_slot', 'doctor_id', 'appointment_date', 'appointment_time', 'status'),
+        # Patient dashboard / history filters
+        db.Index('ix_appointments_patient_status', 'patient_id', 'status', 'appointment_date'),
+        # Admin listing order and date/status filters
+        db.Index('ix_appointments_date_status', 'appointment_date', 'status'),
+        db.Index('ix_appointments_date_time', 'appointment_date', 'appointment_time'),
+        db.Index('ix_appointments_created_at', 'created_at'),
+        # At most one booked appointment per doctor slot
+        db.Index(
+            'ux_appointments_booked_slot', 'doctor_id', 'appointment_date', 'appointment_time',
+            unique=True,
+            sqlite_where=db.text("status = 'Booked'"),
+            postgresql_where=db.text("status = 'Booked'")
+        ),
+    )
     id = db.Column(db.Integer, primary_key=True)
     patient_id = db.Column(db.Integer, db.ForeignKey('patients.id'), nullable=False)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
@@ -85,6 +115,9 @@ class Appointment(db.Model):
 
 class Treatment(db.Model):
     __tablename__ = 'treatments'
+    __table_args__ = (
+        db.Index('ix_treatments_appointment_id', 'appointment_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id'), nullable=False)
     diagnosis = db.Column(db.Text)
@@ -94,3 +127,18 @@ class Treatment(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+
+class StatCounter(db.Model):
+    """Dashboard counters maintained by stats.py; scope is 'hospital', 'doctor' or 'date'"""
+    __tablename__ = 'stat_counters'
+    scope = db.Column(db.String(20), primary_key=True)
+    scope_id = db.Column(db.Integer, primary_key=True)  # 0 for hospital, doctor id, or date ordinal
+    name = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
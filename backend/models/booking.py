@@ -0,0 +1,83 @@
+from sqlalchemy.exc import IntegrityError
+from datetime import date
+
+from models import db, Appointment, DoctorAvailability
+
+
+class BookingError(Exception):
+    """Booking rejected; carries the HTTP status the route should return"""
+    status_code = 400
+
+
+class SlotTaken(BookingError):
+    status_code = 409
+
+
+SLOT_INDEX = 'ux_appointments_booked_slot'
+
+
+def _is_slot_conflict(error):
+    """Whether an IntegrityError is a violation of the booked-slot unique index"""
+    diag = getattr(error.orig, 'diag', None)
+    if getattr(diag, 'constraint_name', None):
+        # PostgreSQL reports the constraint by name
+        return diag.constraint_name == SLOT_INDEX
+    message = str(error.orig)
+    if SLOT_INDEX in message:
+        return True
+    # SQLite names the columns instead of the index
+    index = next(ix for ix in Appointment.__table__.indexes if ix.name == SLOT_INDEX)
+    columns = ', '.join(f'{Appointment.__tablename__}.{column.name}' for column in index.columns)
+    return message == f'UNIQUE constraint failed: {columns}'
+
+
+def _check_slot(doctor_id, appointment_date, appointment_time):
+    if appointment_date < date.today():
+        raise BookingError('Cannot book appointments in the past')
+    available = db.session.query(DoctorAvailability.id).filter(
+        DoctorAvailability.doctor_id == doctor_id,
+        DoctorAvailability.date == appointment_date,
+        DoctorAvailability.is_available == True,
+        DoctorAvailability.start_time <= appointment_time,
+        DoctorAvailability.end_time > appointment_time
+    ).first()
+    if not available:
+        raise BookingError('Doctor is not available at this time')
+
+
+def _commit_slot():
+    # Uniqueness of booked (doctor, date, time) is enforced by the partial
+    # unique index ux_appointments_booked_slot, so concurrent requests for
+    # the same slot cannot both commit. Other integrity errors are bugs, not conflicts.
+    try:
+        db.session.commit()
+    except IntegrityError as e:
+        db.session.rollback()
+        if _is_slot_conflict(e):
+            raise SlotTaken('This slot has already been booked')
+        raise
+
+
+def book_slot(patient_id, doctor_id, appointment_date, appointment_time, reason=None):
+    """Book a slot for a patient; raises BookingError / SlotTaken"""
+    _check_slot(doctor_id, appointment_date, appointment_time)
+    appointment = Appointment(
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        appointment_date=appointment_date,
+        appointment_time=appointment_time,
+        reason=reason,
+        status='Booked'
+    )
+    db.session.add(appointment)
+    _commit_slot()
+    return appointment
+
+
+def move_slot(appointment, appointment_date, appointment_time):
+    """Move a booked appointment to a new date and/or time; raises BookingError / SlotTaken"""
+    _check_slot(appointment.doctor_id, appointment_date, appointment_time)
+    appointment.appointment_date = appointment_date
+    appointment.appointment_time = appointment_time
+    _commit_slot()
+    return appointment
@@ -0,0 +1,109 @@
+from flask import request, jsonify
+from sqlalchemy import tuple_, literal
+from sqlalchemy.orm import joinedload
+from datetime import date, time
+import base64
+import json
+
+from models import Appointment, DoctorAvailability
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def appointment_query():
+    """Appointment query with patient, doctor and treatment loaded in the same SELECT"""
+    return Appointment.query.options(
+        joinedload(Appointment.patient),
+        joinedload(Appointment.doctor),
+        joinedload(Appointment.treatment)
+    )
+
+
+def availability_by_doctor(doctor_ids, start, end):
+    """Available slots between start and end for many doctors in one query, keyed by doctor id"""
+    grouped = {doctor_id: [] for doctor_id in doctor_ids}
+    if not grouped:
+        return grouped
+    rows = DoctorAvailability.query.filter(
+        DoctorAvailability.doctor_id.in_(grouped),
+        DoctorAvailability.date >= start,
+        DoctorAvailability.date <= end,
+        DoctorAvailability.is_available == True
+    ).order_by(DoctorAvailability.doctor_id, DoctorAvailability.date).all()
+    for avail in rows:
+        grouped[avail.doctor_id].append(avail)
+    return grouped
+
+
+def encode_cursor(values):
+    """Encode key values of the last row of a page as an opaque cursor"""
+    raw = json.dumps([v.isoformat() if isinstance(v, (date, time)) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """Decode a cursor back into typed key values; raises ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise ValueError('Invalid cursor')
+    decoded = []
+    for key, value in zip(keys, values):
+        python_type = key.type.python_type
+        if python_type in (date, time):
+            if not isinstance(value, str):
+                raise ValueError('Invalid cursor')
+            try:
+                value = python_type.fromisoformat(value)
+            except ValueError:
+                raise ValueError('Invalid cursor')
+        elif not isinstance(value, python_type):
+            raise ValueError('Invalid cursor')
+        decoded.append(value)
+    return decoded
+
+
+def paginated(query, keys, serialize, descending=False):
+    """Keyset-paginate query on keys (last key must be unique) and build the JSON response.
+
+    Reads ``cursor`` and ``limit`` from the request args. Passing ``all=true``
+    keeps the legacy behaviour of returning the complete list.
+    """
+    ordering = [key.desc() if descending else key for key in keys]
+
+    if request.args.get('all', '').lower() in ('1', 'true', 'yes'):
+        return jsonify([serialize(row) for row in query.order_by(*ordering).all()]), 200
+
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            last = decode_cursor(cursor, keys)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        boundary = tuple_(*[literal(value, key.type) for key, value in zip(keys, last)])
+        if descending:
+            query = query.filter(tuple_(*keys) < boundary)
+        else:
+            query = query.filter(tuple_(*keys) > boundary)
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(*ordering).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], key.key) for key in keys])
+
+    return jsonify({
+        'items': [serialize(row) for row in rows],
+        'next_cursor': next_cursor
+    }), 200
@@ -0,0 +1,96 @@
+"""Read-replica routing for db.session
+
+When SQLALCHEMY_BINDS has a 'replica' engine, blueprints that call
+route_reads_to_replica() before each request send GET handlers' queries there.
+Flushes always go to the primary. A user who committed a write within the last
+REPLICA_READ_YOUR_WRITES seconds reads from the primary, so their own changes
+are visible even if the replica lags; accounts created by the write get the
+same window. Use primary() around reads whose results are stored (caches,
+snapshots) so lagging data is never persisted.
+"""
+from flask import g, request, current_app, has_request_context, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from contextlib import contextmanager
+
+REPLICA_BIND = 'replica'
+RECENT_WRITE_KEY = 'db:recent-write:{}'
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _reads_from_replica():
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _reads_from_replica():
+    if not has_request_context() or not g.get('_replica_candidate') or g.get('_primary_depth'):
+        return False
+    decided = g.get('_read_replica')
+    if decided is None:
+        user_id = g.get('user_id')
+        if user_id is None:
+            # Auth hasn't run yet; don't pin the decision before we know who is asking
+            return False
+        try:
+            decided = not current_app.redis.exists(RECENT_WRITE_KEY.format(user_id))
+        except Exception:
+            decided = False
+        g._read_replica = decided
+    return decided
+
+
+def route_reads_to_replica():
+    """before_request hook: make GET requests eligible for the replica"""
+    g._replica_candidate = request.method in ('GET', 'HEAD')
+
+
+@contextmanager
+def primary():
+    """Run the enclosed queries on the primary even inside a replica-routed request"""
+    if not has_request_context():
+        yield
+        return
+    g._primary_depth = g.get('_primary_depth', 0) + 1
+    try:
+        yield
+    finally:
+        g._primary_depth -= 1
+
+
+def _note_writes(session, flush_context):
+    from models import User
+    writers = session.info.setdefault('writers', set())
+    writers.update(obj.id for obj in session.new if isinstance(obj, User))
+    if has_request_context() and g.get('user_id') is not None:
+        writers.add(g.user_id)
+        g._read_replica = False
+
+
+def _open_write_window(session):
+    writers = session.info.pop('writers', None)
+    if not writers or not has_app_context() or not current_app.config.get('SQLALCHEMY_BINDS', {}).get(REPLICA_BIND):
+        return
+    window = current_app.config['REPLICA_READ_YOUR_WRITES']
+    try:
+        pipe = current_app.redis.pipeline()
+        for user_id in writers:
+            pipe.setex(RECENT_WRITE_KEY.format(user_id), window, 1)
+        pipe.execute()
+    except Exception:
+        pass
+
+
+def _forget_writes(session):
+    session.info.pop('writers', None)
+
+
+def register_replica_routing():
+    """Install the session hooks that open read-your-writes windows after commits"""
+    if not event.contains(RoutingSession, 'after_commit', _open_write_window):
+        event.listen(RoutingSession, 'after_flush', _note_writes)
+        event.listen(RoutingSession, 'after_commit', _open_write_window)
+        event.listen(RoutingSession, 'after_rollback', _forget_writes)
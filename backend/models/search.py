@@ -0,0 +1,71 @@
+"""Substring search over doctors and patients backed by SQLite FTS5 trigram indexes
+
+The FTS tables are external-content shadows of `doctors` and `patients`,
+created by migration 3 and kept in sync by triggers. Terms shorter than a
+trigram, or databases without the index, fall back to ILIKE.
+"""
+from sqlalchemy import or_, select, table, column, literal_column, inspect
+
+from models import db, Doctor, Patient
+
+# fts table -> (content table, indexed columns)
+FTS_INDEXES = {
+    'doctors_fts': ('doctors', ('name', 'specialization')),
+    'patients_fts': ('patients', ('name', 'phone')),
+}
+
+_MODEL_FTS = {Doctor: 'doctors_fts', Patient: 'patients_fts'}
+_available = {}
+
+
+def fts_ddl():
+    """DDL creating each FTS table, its sync triggers and the initial index build"""
+    statements = []
+    for fts, (source, columns) in FTS_INDEXES.items():
+        cols = ', '.join(columns)
+        new_vals = ', '.join(f'new.{c}' for c in columns)
+        old_vals = ', '.join(f'old.{c}' for c in columns)
+        statements += [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+            f"{cols}, content='{source}', content_rowid='id', tokenize='trigram')",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {source} BEGIN "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {source} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {source} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_vals}); "
+            f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+            f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+        ]
+    return statements
+
+
+def fts_available(fts):
+    """Whether the FTS table exists on the current engine (checked once per process)"""
+    if fts not in _available:
+        engine = db.engine
+        _available[fts] = engine.dialect.name == 'sqlite' and inspect(engine).has_table(fts)
+    return _available[fts]
+
+
+def text_search(query, model, columns, term, ranked=False):
+    """Restrict query to rows where any of columns contains term (case-insensitive).
+
+    With ranked=True, FTS matches are ordered best first.
+    """
+    fts = _MODEL_FTS[model]
+    if len(term) < 3 or not fts_available(fts):
+        return query.filter(or_(*[getattr(model, c).ilike(f'%{term}%') for c in columns]))
+
+    # Quote the term as a single FTS phrase so user input is never parsed as query syntax
+    phrase = '"' + term.replace('"', '""') + '"'
+    expr = '{' + ' '.join(columns) + '} : ' + phrase
+    fts_table = table(fts, column('rowid'), column('rank'))
+    matches = select(
+        fts_table.c.rowid.label('id'),
+        fts_table.c.rank.label('rank')
+    ).where(literal_column(fts).op('MATCH')(expr)).subquery()
+    query = query.join(matches, model.id == matches.c.id)
+    if ranked:
+        query = query.order_by(matches.c.rank)
+    return query
@@ -0,0 +1,255 @@
+"""Outbound notification delivery used by the Celery jobs"""
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from urllib.parse import urlsplit
+import queue
+import smtplib
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: rate limited or transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least 1/rate seconds apart"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class WebhookDispatcher:
+    """Posts JSON messages concurrently over one pooled HTTP session.
+
+    Each endpoint (scheme + host) gets its own rate limiter; failed posts are
+    retried with exponential backoff, or after the server's Retry-After. A
+    Retry-After longer than max_retry_after fails the message instead of
+    holding a pool thread. send_all() returns one result dict per message so
+    callers can account for every delivery.
+    """
+
+    def __init__(self, max_workers=8, rate_per_endpoint=10.0, max_retries=3,
+                 backoff=0.5, timeout=5, max_retry_after=30):
+        self.max_workers = max_workers
+        self.rate_per_endpoint = rate_per_endpoint
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_retry_after = max_retry_after
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._limiters = {}
+        self._limiters_lock = threading.Lock()
+
+    def _limiter(self, url):
+        parts = urlsplit(url)
+        endpoint = f'{parts.scheme}://{parts.netloc}'
+        with self._limiters_lock:
+            if endpoint not in self._limiters:
+                self._limiters[endpoint] = RateLimiter(self.rate_per_endpoint)
+            return self._limiters[endpoint]
+
+    def send(self, url, payload, message_id=None):
+        """Post one message with retries; never raises"""
+        limiter = self._limiter(url)
+        result = {'id': message_id, 'ok': False, 'status': None, 'attempts': 0, 'error': None}
+        for attempt in range(self.max_retries + 1):
+            limiter.wait()
+            result['attempts'] = attempt + 1
+            retry_after = None
+            try:
+                response = self.session.post(url, json=payload, timeout=self.timeout)
+                result['status'] = response.status_code
+                if response.ok:
+                    result['ok'] = True
+                    result['error'] = None
+                    return result
+                result['error'] = f'HTTP {response.status_code}'
+                if response.status_code not in RETRY_STATUSES:
+                    return result
+                retry_after = response.headers.get('Retry-After')
+            except requests.RequestException as e:
+                result['error'] = str(e)
+            if attempt < self.max_retries:
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = self.backoff * (2 ** attempt)
+                if delay > self.max_retry_after:
+                    result['error'] += f' (Retry-After {retry_after}s exceeds {self.max_retry_after}s)'
+                    return result
+                time.sleep(delay)
+        return result
+
+    def send_all(self, url, messages):
+        """Send (message_id, payload) pairs with bounded concurrency; returns results in order"""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(self.send, url, payload, message_id) for message_id, payload in messages]
+            return [future.result() for future in futures]
+
+    def close(self):
+        self.session.close()
+
+
+class SMTPMailer:
+    """Sends mail over a small pool of authenticated SMTP connections.
+
+    Connections are opened lazily (up to max_connections), kept open for the
+    whole batch and replaced when the server drops them. send_all() returns
+    one result dict per recipient.
+    """
+
+    def __init__(self, server, port, username, password, use_tls=True,
+                 max_connections=4, max_retries=1, timeout=30):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.max_connections = max_connections
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        conn = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                conn.starttls()
+            if self.username and self.password:
+                conn.login(self.username, self.password)
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    def _acquire(self):
+        while True:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self._lock:
+                can_open = self._opened < self.max_connections
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                break
+            # Pool exhausted: wait for a connection to be returned or dropped
+            try:
+                return self._idle.get(timeout=1)
+            except queue.Empty:
+                continue
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def _release(self, conn, broken=False):
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+            with self._lock:
+                self._opened -= 1
+        else:
+            self._idle.put(conn)
+
+    def send(self, to_email, subject, html_body, message_id=None):
+        """Send one HTML message, reconnecting on connection failures; never raises"""
+        result = {'id': message_id, 'recipient': to_email, 'ok': False, 'attempts': 0, 'error': None}
+        if not to_email:
+            result['error'] = 'No email address'
+            return result
+        msg = MIMEText(html_body, 'html')
+        msg['Subject'] = subject
+        msg['From'] = self.username
+        msg['To'] = to_email
+        for attempt in range(self.max_retries + 1):
+            result['attempts'] = attempt + 1
+            try:
+                conn = self._acquire()
+            except Exception as e:
+                result['error'] = str(e)
+                continue
+            try:
+                conn.sendmail(self.username, [to_email], msg.as_string())
+            except smtplib.SMTPServerDisconnected as e:
+                # Connection is unusable; drop it and retry on a fresh one
+                self._release(conn, broken=True)
+                result['error'] = str(e)
+                continue
+            except smtplib.SMTPException as e:
+                # Rejected by the server (bad recipient etc.); the connection is still fine
+                self._release(conn)
+                result['error'] = str(e)
+                return result
+            except OSError as e:
+                self._release(conn, broken=True)
+                result['error'] = str(e)
+                continue
+            self._release(conn)
+            result['ok'] = True
+            result['error'] = None
+            return result
+        return result
+
+    def send_all(self, messages):
+        """Send (message_id, to_email, subject, html_body) tuples in parallel; returns results in order.
+
+        messages may be a generator: each message is submitted as soon as it is
+        produced, so producing the next one overlaps with sending.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_connections) as pool:
+            futures = [
+                pool.submit(self.send, to_email, subject, html_body, message_id)
+                for message_id, to_email, subject, html_body in messages
+            ]
+            return [future.result() for future in futures]
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.quit()
+            except Exception:
+                conn.close()
+        with self._lock:
+            self._opened = 0
+
+
+def summarize(results):
+    """Collapse per-message results into the counts returned by tasks"""
+    failures = [r for r in results if not r['ok']]
+    return {
+        'total': len(results),
+        'sent': len(results) - len(failures),
+        'failed': len(failures),
+        'failures': failures
+    }
@@ -0,0 +1,92 @@
+"""Password hashing off the request thread
+
+Hashes are computed on a small per-process thread pool (hashlib releases the
+GIL while scrypt/pbkdf2 run), so a burst of logins occupies at most
+PASSWORD_HASH_WORKERS cores and other requests keep being served. At most
+PASSWORD_HASH_QUEUE jobs wait behind the running ones; beyond that callers get
+HashingBusy and should answer 503 instead of piling up.
+
+PASSWORD_HASH_METHOD is any werkzeug method string ('scrypt:32768:8:1',
+'pbkdf2:sha256:600000'). A successful login with a hash made under other
+parameters returns a fresh hash for the caller to store.
+"""
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import os
+import threading
+
+_pool = None
+_slots = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_method_prefixes = {}
+
+
+class HashingBusy(Exception):
+    """Too many hashes are queued; retry later"""
+
+
+def password_method(config=None):
+    return (config or current_app.config)['PASSWORD_HASH_METHOD']
+
+
+def password_hasher(config=None):
+    """Picklable generate_password_hash bound to the configured method (for process pools)"""
+    return partial(generate_password_hash, method=password_method(config))
+
+
+def _method_prefix(method):
+    """The parameter prefix werkzeug writes for method, with its defaults filled in"""
+    if method not in _method_prefixes:
+        _method_prefixes[method] = generate_password_hash('', method=method).split('$', 1)[0]
+    return _method_prefixes[method]
+
+
+def needs_rehash(password_hash, method=None):
+    """True if password_hash was not made with the configured method and cost"""
+    return password_hash.split('$', 1)[0] != _method_prefix(method or password_method())
+
+
+def _executor():
+    global _pool, _slots, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            # Threads don't survive a fork; each worker process gets its own pool
+            workers = current_app.config['PASSWORD_HASH_WORKERS']
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+            _slots = threading.BoundedSemaphore(workers + current_app.config['PASSWORD_HASH_QUEUE'])
+            _pool_pid = os.getpid()
+        return _pool, _slots
+
+
+def _run(fn, *args):
+    pool, slots = _executor()
+    if not slots.acquire(blocking=False):
+        raise HashingBusy('Password hashing queue is full')
+    try:
+        future = pool.submit(fn, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+    return future.result()
+
+
+def hash_password(password):
+    """Hash password with the configured method on the hashing pool"""
+    return _run(generate_password_hash, password, password_method())
+
+
+def _verify(password_hash, password, method):
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash, method):
+        return True, generate_password_hash(password, method=method)
+    return True, None
+
+
+def verify_password(password_hash, password):
+    """Check password on the hashing pool; returns (ok, replacement hash or None)"""
+    return _run(_verify, password_hash, password, password_method())
@@ -1,47 +1,50 @@
-from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash
+from flask import Blueprint, request, jsonify, g, send_file
+from flask_jwt_extended import jwt_required, get_jwt
 from datetime import datetime, date, timedelta
-from sqlalchemy import or_, func
-import json
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, contains_eager
+from uuid import uuid4
 
 from models import db, User, Department, Doctor, Patient, Appointment, Treatment, DoctorAvailability
+from models.routing import route_reads_to_replica
+from models.queries import appointment_query, paginated
+from models.search import text_search
+from routes.auth import deactivate_user, RevocationError, busy_response
+from directory import mark_doctor_changed
+from cache import cached, cache_stats
+from stats import read_counters, booked_between
+from imports import IMPORT_KINDS, IMPORT_FORMATS, detect_format
+from passwords import hash_password, HashingBusy
+from artifacts import save_artifact, load_artifact_meta, artifact_path
+from celery.result import AsyncResult
+from celery_tasks import celery, import_accounts as import_accounts_task
 
 admin_bp = Blueprint('admin', __name__)
+admin_bp.before_request(route_reads_to_replica)
 
 def require_admin(fn):
-    """Decorator to require admin role"""
+    """Decorator to require admin role (trusts the role claim set at login)"""
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        user = User.query.get(user_id)
-        if not user or user.role != 'admin':
+        claims = get_jwt()
+        if claims.get('role') != 'admin':
             return jsonify({'error': 'Admin access required'}), 403
+        g.user_id = int(claims['sub'])
         return fn(*args, **kwargs)
     wrapper.__name__ = fn.__name__
     return jwt_required()(wrapper)
 
 @admin_bp.route('/dashboard', methods=['GET'])
 @require_admin
+@cached('dashboard', ttl=300, stale_ttl=600)
 def get_dashboard_stats():
     """Get dashboard statistics"""
     try:
-        cache_key = 'admin:dashboard'
-        cached = current_app.redis.get(cache_key)
-        if cached:
-            return jsonify(json.loads(cached)), 200
-
-        total_doctors = Doctor.query.count()
-        total_patients = Patient.query.count()
-        total_appointments = Appointment.query.count()
-        upcoming_appointments = Appointment.query.filter(
-            Appointment.appointment_date >= date.today(),
-            Appointment.status == 'Booked'
-        ).count()
-        recent_appointments = Appointment.query.order_by(
+        counters = read_counters('hospital', 0)
+        total_doctors = counters.get('doctors', 0)
+        total_patients = counters.get('patients', 0)
+        total_appointments = counters.get('appointments', 0)
+        upcoming_appointments = booked_between(date.today())
+        recent_appointments = appointment_query().order_by(
             Appointment.created_at.desc()
         ).limit(5).all()
         payload = {
@@ -58,7 +61,6 @@ def get_dashboard_stats():
                 'status': apt.status
             } for apt in recent_appointments]
         }
-        current_app.redis.setex(cache_key, current_app.config['CACHE_DEFAULT_TIMEOUT'], json.dumps(payload))
         return jsonify(payload), 200
         
     except Exception as e:
@@ -66,13 +68,10 @@ def get_dashboard_stats():
 
 @admin_bp.route('/departments', methods=['GET'])
 @require_admin
+@cached('departments', ttl=86400)
 def get_departments():
     """Get all departments"""
     try:
-        cache_key = 'departments:all'
-        cached = current_app.redis.get(cache_key)
-        if cached:
-            return jsonify(json.loads(cached)), 200
         departments = Department.query.all()
         payload = [{
             'id': dept.id,
@@ -80,7 +79,6 @@ def get_departments():
             'description': dept.description,
             'doctors_count': len(dept.doctors)
         } for dept in departments]
-        current_app.redis.setex(cache_key, current_app.config['CACHE_DEFAULT_TIMEOUT'], json.dumps(payload))
         return jsonify(payload), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -95,16 +93,11 @@ def get_doctors():
         query = Doctor.query.join(User).filter(User.is_active == True)
         
         if search:
-            query = query.filter(
-                or_(
-                    Doctor.name.ilike(f'%{search}%'),
-                    Doctor.specialization.ilike(f'%{search}%')
-                )
-            )
+            query = text_search(query, Doctor, ['name', 'specialization'], search)
         
-        doctors = query.all()
+        query = query.options(joinedload(Doctor.department), contains_eager(Doctor.user))
         
-        return jsonify([{
+        return paginated(query, [Doctor.id], lambda doc: {
             'id': doc.id,
             'user_id': doc.user_id,
             'name': doc.name,
@@ -115,7 +108,7 @@ def get_doctors():
             'experience_years': doc.experience_years,
             'qualification': doc.qualification,
             'is_active': doc.user.is_active
-        } for doc in doctors]), 200
+        })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -143,7 +136,7 @@ def create_doctor():
         user = User(
             username=data['username'],
             email=data['email'],
-            password=generate_password_hash(data['password']),
+            password=hash_password(data['password']),
             role='doctor'
         )
         db.session.add(user)
@@ -161,11 +154,7 @@ def create_doctor():
         )
         db.session.add(doctor)
         db.session.commit()
-        # Invalidate cached dashboard/departments
-        try:
-            current_app.redis.delete('admin:dashboard', 'departments:all')
-        except Exception:
-            pass
+        mark_doctor_changed(doctor.id)
         
         return jsonify({
             'message': 'Doctor created successfully',
@@ -176,6 +165,9 @@ def create_doctor():
             }
         }), 201
         
+    except HashingBusy:
+        db.session.rollback()
+        return busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -210,10 +202,7 @@ def update_doctor(doctor_id):
             doctor.user.email = data['email']
         
         db.session.commit()
-        try:
-            current_app.redis.delete('admin:dashboard', 'departments:all')
-        except Exception:
-            pass
+        mark_doctor_changed(doctor.id)
         
         return jsonify({
             'message': 'Doctor updated successfully',
@@ -237,12 +226,11 @@ def delete_doctor(doctor_id):
         if not doctor:
             return jsonify({'error': 'Doctor not found'}), 404
         
-        doctor.user.is_active = False
-        db.session.commit()
         try:
-            current_app.redis.delete('admin:dashboard', 'departments:all')
-        except Exception:
-            pass
+            deactivate_user(doctor.user)
+        except RevocationError as e:
+            return jsonify({'error': str(e)}), 503
+        mark_doctor_changed(doctor.id)
         
         return jsonify({'message': 'Doctor deactivated successfully'}), 200
         
@@ -260,16 +248,11 @@ def get_patients():
         query = Patient.query.join(User).filter(User.is_active == True)
         
         if search:
-            query = query.filter(
-                or_(
-                    Patient.name.ilike(f'%{search}%'),
-                    Patient.phone.ilike(f'%{search}%')
-                )
-            )
+            query = text_search(query, Patient, ['name', 'phone'], search)
         
-        patients = query.all()
+        query = query.options(contains_eager(Patient.user))
         
-        return jsonify([{
+        return paginated(query, [Patient.id], lambda pat: {
             'id': pat.id,
             'user_id': pat.user_id,
             'name': pat.name,
@@ -280,7 +263,7 @@ def get_patients():
             'blood_group': pat.blood_group,
             'email': pat.user.email,
             'is_active': pat.user.is_active
-        } for pat in patients]), 200
+        })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -314,10 +297,6 @@ def update_patient(patient_id):
             patient.user.email = data['email']
         
         db.session.commit()
-        try:
-            current_app.redis.delete('admin:dashboard')
-        except Exception:
-            pass
         
         return jsonify({'message': 'Patient updated successfully'}), 200
         
@@ -334,12 +313,10 @@ def delete_patient(patient_id):
         if not patient:
             return jsonify({'error': 'Patient not found'}), 404
         
-        patient.user.is_active = False
-        db.session.commit()
         try:
-            current_app.redis.delete('admin:dashboard')
-        except Exception:
-            pass
+            deactivate_user(patient.user)
+        except RevocationError as e:
+            return jsonify({'error': str(e)}), 503
         
         return jsonify({'message': 'Patient deactivated successfully'}), 200
         
@@ -354,17 +331,13 @@ def get_all_appointments():
     try:
         status = request.args.get('status')
         
-        query = Appointment.query
+        query = appointment_query()
         
         if status:
             query = query.filter(Appointment.status == status)
         
-        appointments = query.order_by(
-            Appointment.appointment_date.desc(),
-            Appointment.appointment_time.desc()
-        ).all()
-        
-        return jsonify([{
+        keys = [Appointment.appointment_date, Appointment.appointment_time, Appointment.id]
+        return paginated(query, keys, lambda apt: {
             'id': apt.id,
             'patient_id': apt.patient_id,
             'patient_name': apt.patient.name,
@@ -374,11 +347,92 @@ def get_all_appointments():
             'appointment_time': apt.appointment_time.strftime('%H:%M'),
             'status': apt.status,
             'reason': apt.reason
-        } for apt in appointments]), 200
+        }, descending=True)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/import/<kind>', methods=['POST'])
+@require_admin
+def import_accounts(kind):
+    """Store a CSV or NDJSON upload and bulk-create its doctor or patient accounts on a Celery worker"""
+    try:
+        if kind not in IMPORT_KINDS:
+            return jsonify({'error': 'Unknown import type'}), 404
+        
+        # Multipart upload ('file') or the raw request body
+        upload = request.files.get('file')
+        stream = upload.stream if upload else request.stream
+        fmt = detect_format(upload.filename if upload else None, request.args.get('format'))
+        if fmt not in IMPORT_FORMATS:
+            return jsonify({'error': f'Unsupported format; expected one of {", ".join(IMPORT_FORMATS)}'}), 400
+        
+        # The worker reads the file from the shared artifact store, not through the broker
+        task_id = str(uuid4())
+        upload_id = f'upload-{task_id}'
+        save_artifact(upload_id, iter(lambda: stream.read(64 * 1024), b''), filename=upload.filename if upload else None)
+        import_accounts_task.apply_async(args=[kind, fmt, upload_id], task_id=task_id)
+        
+        return jsonify({
+            'task_id': task_id,
+            'status_url': f'/api/admin/import/status/{task_id}'
+        }), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/import/status/<task_id>', methods=['GET'])
+@require_admin
+def import_status(task_id):
+    """Progress of a bulk import; counts and the error report link once it has finished"""
+    try:
+        result = AsyncResult(task_id, app=celery)
+        response = {
+            'task_id': task_id,
+            'state': result.state,
+            'ready': result.ready()
+        }
+        if result.ready():
+            if not result.successful():
+                response['error'] = 'Import failed'
+                return jsonify(response), 200
+            summary = result.result
+            report_id = summary['report_id']
+            response.update({
+                'kind': summary['kind'],
+                'created': summary['created'],
+                'failed': summary['failed'],
+                'report_id': report_id,
+                'report_url': f'/api/admin/import/reports/{report_id}' if report_id else None
+            })
+        return jsonify(response), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/import/reports/<report_id>', methods=['GET'])
+@require_admin
+def download_import_report(report_id):
+    """Download the per-row error report of a bulk import"""
+    try:
+        meta = load_artifact_meta(report_id)
+        if not report_id.startswith('import-') or not meta:
+            return jsonify({'error': 'Report not found or expired'}), 404
+        return send_file(
+            artifact_path(report_id),
+            mimetype='text/csv',
+            as_attachment=True,
+            download_name=meta['filename']
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@admin_bp.route('/cache-stats', methods=['GET'])
+@require_admin
+def get_cache_stats():
+    """Response cache hit/miss counters for the worker serving this request"""
+    return jsonify(cache_stats()), 200
+
 @admin_bp.route('/search', methods=['GET'])
 @require_admin
 def search():
@@ -393,12 +447,9 @@ def search():
         }
         
         if search_type in ['all', 'doctor']:
-            doctors = Doctor.query.join(User).filter(
-                User.is_active == True,
-                or_(
-                    Doctor.name.ilike(f'%{query}%'),
-                    Doctor.specialization.ilike(f'%{query}%')
-                )
+            doctors = text_search(
+                Doctor.query.join(User).filter(User.is_active == True).options(joinedload(Doctor.department)),
+                Doctor, ['name', 'specialization'], query, ranked=True
             ).limit(10).all()
             
             results['doctors'] = [{
@@ -409,12 +460,9 @@ def search():
             } for doc in doctors]
         
         if search_type in ['all', 'patient']:
-            patients = Patient.query.join(User).filter(
-                User.is_active == True,
-                or_(
-                    Patient.name.ilike(f'%{query}%'),
-                    Patient.phone.ilike(f'%{query}%')
-                )
+            patients = text_search(
+                Patient.query.join(User).filter(User.is_active == True).options(contains_eager(Patient.user)),
+                Patient, ['name', 'phone'], query, ranked=True
             ).limit(10).all()
             
             results['patients'] = [{
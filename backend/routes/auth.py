@@ -1,12 +1,68 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import time
 
 from models import db, User, Patient
+from passwords import hash_password, verify_password, HashingBusy
+from cache import conditional
 
 auth_bp = Blueprint('auth', __name__)
 
+# Redis key holding when a user was deactivated; tokens issued up to then are rejected
+INACTIVE_USER_KEY = 'auth:inactive:{}'
+
+class RevocationError(Exception):
+    """The token revocation could not be recorded, so the user was left active"""
+
+def deactivate_user(user):
+    """Deactivate user and reject the tokens already issued to them until they would expire.
+
+    The revocation is recorded before the commit: if Redis can't take it,
+    RevocationError is raised and nothing changes, rather than leaving a
+    deactivated user with working tokens. It only covers tokens issued up to
+    now, so tokens from a later login work once the user is reactivated.
+    """
+    key = INACTIVE_USER_KEY.format(user.id)
+    try:
+        current_app.redis.setex(key, current_app.config['JWT_ACCESS_TOKEN_EXPIRES'], int(time.time()))
+    except Exception as e:
+        raise RevocationError(f'Could not revoke active sessions, account left active: {e}')
+    user.is_active = False
+    try:
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        try:
+            current_app.redis.delete(key)
+        except Exception:
+            pass
+        raise
+
+def register_jwt_callbacks(jwt):
+    """Install the revocation check run for every protected request"""
+    @jwt.token_in_blocklist_loader
+    def is_token_revoked(jwt_header, jwt_payload):
+        # Tokens issued before role claims existed must log in again
+        if 'role' not in jwt_payload:
+            return True
+        try:
+            revoked_at = current_app.redis.get(INACTIVE_USER_KEY.format(jwt_payload['sub']))
+            # iat has one-second resolution: a token from the second of the deactivation is revoked too
+            return revoked_at is not None and jwt_payload['iat'] <= int(revoked_at)
+        except Exception:
+            # Redis unavailable: fall back to a single-column lookup
+            is_active = db.session.query(User.is_active).filter(
+                User.id == int(jwt_payload['sub'])
+            ).scalar()
+            return not is_active
+
+def busy_response():
+    """503 for when the password hashing queue is full"""
+    response = jsonify({'error': 'Server busy, please try again'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new patient"""
@@ -29,7 +85,7 @@ def register():
         user = User(
             username=data['username'],
             email=data['email'],
-            password=generate_password_hash(data['password']),
+            password=hash_password(data['password']),
             role='patient'
         )
         db.session.add(user)
@@ -58,6 +114,9 @@ def register():
             }
         }), 201
         
+    except HashingBusy:
+        db.session.rollback()
+        return busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -73,28 +132,41 @@ def login():
         
         user = User.query.filter_by(username=data['username']).first()
         
-        if not user or not check_password_hash(user.password, data['password']):
+        if not user:
+            return jsonify({'error': 'Invalid credentials'}), 401
+        
+        ok, new_hash = verify_password(user.password, data['password'])
+        if not ok:
             return jsonify({'error': 'Invalid credentials'}), 401
         
         if not user.is_active:
             return jsonify({'error': 'Account is inactive'}), 401
         
-        # Create access token (string identity to satisfy PyJWT 'sub' claim type)
-        access_token = create_access_token(identity=str(user.id))
+        if new_hash:
+            # Stored with outdated hashing parameters; upgrade while we have the password
+            user.password = new_hash
+            db.session.commit()
         
         # Get role-specific info
         role_data = {}
+        claims = {'role': user.role}
         if user.role == 'doctor' and user.doctor:
             role_data = {
                 'doctor_id': user.doctor.id,
                 'name': user.doctor.name,
                 'specialization': user.doctor.specialization
             }
+            claims['doctor_id'] = user.doctor.id
         elif user.role == 'patient' and user.patient:
             role_data = {
                 'patient_id': user.patient.id,
                 'name': user.patient.name
             }
+            claims['patient_id'] = user.patient.id
+        
+        # Create access token (string identity to satisfy PyJWT 'sub' claim type).
+        # Role and profile id claims let the role decorators skip the user lookup.
+        access_token = create_access_token(identity=str(user.id), additional_claims=claims)
         
         return jsonify({
             'access_token': access_token,
@@ -107,11 +179,15 @@ def login():
             }
         }), 200
         
+    except HashingBusy:
+        return busy_response()
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 @auth_bp.route('/me', methods=['GET'])
 @jwt_required()
+@conditional
 def get_current_user():
     """Get current user info"""
     try:
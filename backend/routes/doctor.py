@@ -1,37 +1,37 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask import Blueprint, request, jsonify, g
+from flask_jwt_extended import jwt_required, get_jwt
 from datetime import datetime, date, timedelta, time
+from sqlalchemy import func, case, literal, Date
 
 from models import db, User, Doctor, Patient, Appointment, Treatment, DoctorAvailability
+from models.routing import route_reads_to_replica
+from models.queries import appointment_query, paginated
+from directory import mark_doctor_changed
+from cache import cached, conditional
+from stats import read_counters
 
 doctor_bp = Blueprint('doctor', __name__)
+doctor_bp.before_request(route_reads_to_replica)
 
 def require_doctor(fn):
-    """Decorator to require doctor role"""
+    """Decorator to require doctor role; exposes g.user_id and g.doctor_id from the token claims"""
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        user = User.query.get(user_id)
-        if not user or user.role != 'doctor':
+        claims = get_jwt()
+        if claims.get('role') != 'doctor' or not claims.get('doctor_id'):
             return jsonify({'error': 'Doctor access required'}), 403
+        g.user_id = int(claims['sub'])
+        g.doctor_id = claims['doctor_id']
         return fn(*args, **kwargs)
     wrapper.__name__ = fn.__name__
     return jwt_required()(wrapper)
 
 @doctor_bp.route('/dashboard', methods=['GET'])
 @require_doctor
+@cached('doctor-dashboard', ttl=300, per_user=True, tags=lambda: [f'doctor:{g.doctor_id}', 'departments'])
 def get_dashboard():
     """Get doctor dashboard statistics"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
+        doctor = Doctor.query.get(g.doctor_id)
         
         if not doctor:
             return jsonify({'error': 'Doctor profile not found'}), 404
@@ -40,7 +40,7 @@ def get_dashboard():
         today = date.today()
         next_week = today + timedelta(days=7)
         
-        upcoming_appointments = Appointment.query.filter(
+        upcoming_appointments = appointment_query().filter(
             Appointment.doctor_id == doctor.id,
             Appointment.appointment_date >= today,
             Appointment.appointment_date <= next_week,
@@ -53,16 +53,10 @@ def get_dashboard():
         # Today's appointments
         today_appointments = [apt for apt in upcoming_appointments if apt.appointment_date == today]
         
-        # Unique patients
-        unique_patients = db.session.query(Patient).join(Appointment).filter(
-            Appointment.doctor_id == doctor.id
-        ).distinct().count()
-        
-        # Total completed appointments
-        completed_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor.id,
-            Appointment.status == 'Completed'
-        ).count()
+        # Unique patients and completed appointments, maintained by stats.py
+        counters = read_counters('doctor', doctor.id)
+        unique_patients = counters.get('patients', 0)
+        completed_appointments = counters.get('completed_appointments', 0)
         
         return jsonify({
             'doctor_info': {
@@ -97,29 +91,17 @@ def get_dashboard():
 def get_appointments():
     """Get doctor's appointments"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
-        
-        if not doctor:
-            return jsonify({'error': 'Doctor profile not found'}), 404
+        doctor_id = g.doctor_id
         
         status = request.args.get('status')
         
-        query = Appointment.query.filter(Appointment.doctor_id == doctor.id)
+        query = appointment_query().filter(Appointment.doctor_id == doctor_id)
         
         if status:
             query = query.filter(Appointment.status == status)
         
-        appointments = query.order_by(
-            Appointment.appointment_date.desc(),
-            Appointment.appointment_time.desc()
-        ).all()
-        
-        return jsonify([{
+        keys = [Appointment.appointment_date, Appointment.appointment_time, Appointment.id]
+        return paginated(query, keys, lambda apt: {
             'id': apt.id,
             'patient_id': apt.patient_id,
             'patient_name': apt.patient.name,
@@ -129,7 +111,7 @@ def get_appointments():
             'status': apt.status,
             'reason': apt.reason,
             'has_treatment': apt.treatment is not None
-        } for apt in appointments]), 200
+        }, descending=True)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -139,18 +121,13 @@ def get_appointments():
 def complete_appointment(appointment_id):
     """Mark appointment as completed and add treatment"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
+        doctor_id = g.doctor_id
         
         appointment = Appointment.query.get(appointment_id)
         if not appointment:
             return jsonify({'error': 'Appointment not found'}), 404
         
-        if appointment.doctor_id != doctor.id:
+        if appointment.doctor_id != doctor_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
         data = request.get_json()
@@ -197,18 +174,13 @@ def complete_appointment(appointment_id):
 def cancel_appointment(appointment_id):
     """Cancel an appointment"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
+        doctor_id = g.doctor_id
         
         appointment = Appointment.query.get(appointment_id)
         if not appointment:
             return jsonify({'error': 'Appointment not found'}), 404
         
-        if appointment.doctor_id != doctor.id:
+        if appointment.doctor_id != doctor_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
         appointment.status = 'Cancelled'
@@ -224,36 +196,65 @@ def cancel_appointment(appointment_id):
 @doctor_bp.route('/patients', methods=['GET'])
 @require_doctor
 def get_patients():
-    """Get list of patients assigned to doctor"""
+    """Get list of patients assigned to doctor, with appointment count and last visit.
+
+    Optional ``sort`` (id, name, total_appointments, last_visit) and
+    ``order`` (asc, desc); results are cursor-paginated.
+    """
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
-        
-        if not doctor:
-            return jsonify({'error': 'Doctor profile not found'}), 404
-        
-        # Get unique patients who have appointments with this doctor
-        patients = db.session.query(Patient).join(Appointment).filter(
-            Appointment.doctor_id == doctor.id
-        ).distinct().all()
-        
-        return jsonify([{
-            'id': pat.id,
-            'name': pat.name,
-            'phone': pat.phone,
-            'date_of_birth': pat.date_of_birth.isoformat() if pat.date_of_birth else None,
-            'gender': pat.gender,
-            'blood_group': pat.blood_group,
-            'email': pat.user.email,
-            'total_appointments': Appointment.query.filter(
-                Appointment.patient_id == pat.id,
-                Appointment.doctor_id == doctor.id
-            ).count()
-        } for pat in patients]), 200
+        doctor_id = g.doctor_id
+        
+        sort = request.args.get('sort', 'id')
+        order = request.args.get('order', 'asc')
+        if order not in ('asc', 'desc'):
+            return jsonify({'error': 'Invalid order'}), 400
+        
+        # One row per patient; never-completed patients get date.min so the sort key is never NULL
+        per_patient = db.session.query(
+            Appointment.patient_id.label('patient_id'),
+            func.count(Appointment.id).label('total_appointments'),
+            func.coalesce(
+                func.max(case((Appointment.status == 'Completed', Appointment.appointment_date))),
+                literal(date.min, Date)
+            ).label('last_visit')
+        ).filter(
+            Appointment.doctor_id == doctor_id
+        ).group_by(Appointment.patient_id).subquery()
+        
+        query = db.session.query(
+            Patient.id,
+            Patient.name,
+            Patient.phone,
+            Patient.date_of_birth,
+            Patient.gender,
+            Patient.blood_group,
+            User.email,
+            per_patient.c.total_appointments,
+            per_patient.c.last_visit
+        ).join(
+            per_patient, per_patient.c.patient_id == Patient.id
+        ).join(User, User.id == Patient.user_id)
+        
+        sort_keys = {
+            'id': [Patient.id],
+            'name': [Patient.name, Patient.id],
+            'total_appointments': [per_patient.c.total_appointments, Patient.id],
+            'last_visit': [per_patient.c.last_visit, Patient.id],
+        }
+        if sort not in sort_keys:
+            return jsonify({'error': 'Invalid sort'}), 400
+        
+        return paginated(query, sort_keys[sort], lambda row: {
+            'id': row.id,
+            'name': row.name,
+            'phone': row.phone,
+            'date_of_birth': row.date_of_birth.isoformat() if row.date_of_birth else None,
+            'gender': row.gender,
+            'blood_group': row.blood_group,
+            'email': row.email,
+            'total_appointments': row.total_appointments,
+            'last_visit': row.last_visit.isoformat() if row.last_visit != date.min else None
+        }, descending=order == 'desc')
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -263,12 +264,7 @@ def get_patients():
 def get_patient_history(patient_id):
     """Get patient's treatment history"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
+        doctor_id = g.doctor_id
         
         patient = Patient.query.get(patient_id)
         if not patient:
@@ -277,7 +273,7 @@ def get_patient_history(patient_id):
         # Get all appointments with treatments for this patient with this doctor
         appointments = Appointment.query.filter(
             Appointment.patient_id == patient_id,
-            Appointment.doctor_id == doctor.id,
+            Appointment.doctor_id == doctor_id,
             Appointment.status == 'Completed'
         ).order_by(Appointment.appointment_date.desc()).all()
         
@@ -311,21 +307,18 @@ def get_patient_history(patient_id):
 
 @doctor_bp.route('/availability', methods=['GET'])
 @require_doctor
+@conditional
 def get_availability():
     """Get doctor's availability"""
     try:
-        user_id = get_jwt_identity()
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
-        
-        if not doctor:
-            return jsonify({'error': 'Doctor profile not found'}), 404
+        doctor_id = g.doctor_id
         
         # Get availability for next 7 days
         today = date.today()
         next_week = today + timedelta(days=7)
         
         availability = DoctorAvailability.query.filter(
-            DoctorAvailability.doctor_id == doctor.id,
+            DoctorAvailability.doctor_id == doctor_id,
             DoctorAvailability.date >= today,
             DoctorAvailability.date <= next_week
         ).order_by(DoctorAvailability.date).all()
@@ -346,11 +339,7 @@ def get_availability():
 def set_availability():
     """Set doctor's availability for next 7 days"""
     try:
-        user_id = get_jwt_identity()
-        doctor = Doctor.query.filter_by(user_id=user_id).first()
-        
-        if not doctor:
-            return jsonify({'error': 'Doctor profile not found'}), 404
+        doctor_id = g.doctor_id
         
         data = request.get_json()
         
@@ -364,7 +353,7 @@ def set_availability():
         
         # Check if availability already exists
         existing = DoctorAvailability.query.filter(
-            DoctorAvailability.doctor_id == doctor.id,
+            DoctorAvailability.doctor_id == doctor_id,
             DoctorAvailability.date == avail_date
         ).first()
         
@@ -374,7 +363,7 @@ def set_availability():
             existing.is_available = data.get('is_available', True)
         else:
             availability = DoctorAvailability(
-                doctor_id=doctor.id,
+                doctor_id=doctor_id,
                 date=avail_date,
                 start_time=start_time,
                 end_time=end_time,
@@ -383,6 +372,7 @@ def set_availability():
             db.session.add(availability)
         
         db.session.commit()
+        mark_doctor_changed(doctor_id)
         
         return jsonify({'message': 'Availability set successfully'}), 201
         
@@ -1,52 +1,52 @@
-from flask import Blueprint, request, jsonify, send_file, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime, date, timedelta
+from flask import Blueprint, request, jsonify, send_file, g, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt
+from datetime import datetime, date
 from sqlalchemy import or_
-import csv
-import io
+from sqlalchemy.orm import selectinload
 import os
 
-from models import db, User, Patient, Doctor, Appointment, Treatment, Department, DoctorAvailability
+from models import db, Patient, Appointment, Treatment, Department
+from models.routing import route_reads_to_replica
+from models.queries import appointment_query, paginated
+from models.booking import book_slot, move_slot, BookingError
 from celery.result import AsyncResult
 from celery_tasks import celery, export_patient_treatments
+from exports import iter_treatment_csv, gzip_chunks
+from artifacts import load_artifact_meta, artifact_path, plain_artifact_path
+from directory import get_snapshot
+from cache import cached, conditional
 
 patient_bp = Blueprint('patient', __name__)
+patient_bp.before_request(route_reads_to_replica)
 
 def require_patient(fn):
-    """Decorator to require patient role"""
+    """Decorator to require patient role; exposes g.user_id and g.patient_id from the token claims"""
     def wrapper(*args, **kwargs):
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        user = User.query.get(user_id)
-        if not user or user.role != 'patient':
+        claims = get_jwt()
+        if claims.get('role') != 'patient' or not claims.get('patient_id'):
             return jsonify({'error': 'Patient access required'}), 403
+        g.user_id = int(claims['sub'])
+        g.patient_id = claims['patient_id']
         return fn(*args, **kwargs)
     wrapper.__name__ = fn.__name__
     return jwt_required()(wrapper)
 
 @patient_bp.route('/dashboard', methods=['GET'])
 @require_patient
+@cached('patient-dashboard', ttl=300, per_user=True, tags=lambda: [f'patient:{g.patient_id}', 'departments'])
 def get_dashboard():
     """Get patient dashboard"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        patient = Patient.query.filter_by(user_id=user_id).first()
+        patient = Patient.query.get(g.patient_id)
         
         if not patient:
             return jsonify({'error': 'Patient profile not found'}), 404
         
         # Get all departments
-        departments = Department.query.all()
+        departments = Department.query.options(selectinload(Department.doctors)).all()
         
         # Get upcoming appointments
-        upcoming_appointments = Appointment.query.filter(
+        upcoming_appointments = appointment_query().filter(
             Appointment.patient_id == patient.id,
             Appointment.appointment_date >= date.today(),
             Appointment.status == 'Booked'
@@ -56,7 +56,7 @@ def get_dashboard():
         ).all()
         
         # Get past appointments
-        past_appointments = Appointment.query.filter(
+        past_appointments = appointment_query().filter(
             Appointment.patient_id == patient.id,
             or_(
                 Appointment.appointment_date < date.today(),
@@ -104,15 +104,11 @@ def get_dashboard():
 
 @patient_bp.route('/profile', methods=['GET'])
 @require_patient
+@conditional
 def get_profile():
     """Get patient profile"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        patient = Patient.query.filter_by(user_id=user_id).first()
+        patient = Patient.query.get(g.patient_id)
         
         if not patient:
             return jsonify({'error': 'Patient profile not found'}), 404
@@ -136,12 +132,7 @@ def get_profile():
 def update_profile():
     """Update patient profile"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        patient = Patient.query.filter_by(user_id=user_id).first()
+        patient = Patient.query.get(g.patient_id)
         
         if not patient:
             return jsonify({'error': 'Patient profile not found'}), 404
@@ -179,52 +170,19 @@ def get_doctors():
         department_id = request.args.get('department_id')
         search = request.args.get('search')
         
-        query = Doctor.query.join(Doctor.user).filter(Doctor.user.has(is_active=True))
-        
-        if specialization:
-            query = query.filter(Doctor.specialization.ilike(f'%{specialization}%'))
-        
         if department_id:
-            query = query.filter(Doctor.department_id == department_id)
-        
-        if search:
-            query = query.filter(
-                or_(
-                    Doctor.name.ilike(f'%{search}%'),
-                    Doctor.specialization.ilike(f'%{search}%')
-                )
-            )
-        
-        doctors = query.all()
-        
-        # Get availability for next 7 days
-        today = date.today()
-        next_week = today + timedelta(days=7)
-        
-        result = []
-        for doc in doctors:
-            availability = DoctorAvailability.query.filter(
-                DoctorAvailability.doctor_id == doc.id,
-                DoctorAvailability.date >= today,
-                DoctorAvailability.date <= next_week,
-                DoctorAvailability.is_available == True
-            ).order_by(DoctorAvailability.date).all()
-            
-            result.append({
-                'id': doc.id,
-                'name': doc.name,
-                'specialization': doc.specialization,
-                'department_id': doc.department_id,
-                'department_name': doc.department.name,
-                'phone': doc.phone,
-                'experience_years': doc.experience_years,
-                'qualification': doc.qualification,
-                'availability': [{
-                    'date': avail.date.isoformat(),
-                    'start_time': avail.start_time.strftime('%H:%M'),
-                    'end_time': avail.end_time.strftime('%H:%M')
-                } for avail in availability]
-            })
+            try:
+                department_id = int(department_id)
+            except ValueError:
+                return jsonify({'error': 'Invalid department_id'}), 400
+        
+        # Served from the in-process directory snapshot; no database work unless it is stale
+        doctors = get_snapshot().filter(
+            specialization=specialization,
+            department_id=department_id or None,
+            search=search
+        )
+        result = [doc.to_dict() for doc in doctors]
         
         return jsonify(result), 200
         
@@ -236,15 +194,7 @@ def get_doctors():
 def book_appointment():
     """Book a new appointment"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        patient = Patient.query.filter_by(user_id=user_id).first()
-        
-        if not patient:
-            return jsonify({'error': 'Patient profile not found'}), 404
+        patient_id = g.patient_id
         
         data = request.get_json()
         
@@ -252,36 +202,19 @@ def book_appointment():
         if not all(field in data for field in ['doctor_id', 'appointment_date', 'appointment_time']):
             return jsonify({'error': 'Missing required fields'}), 400
         
-        doctor_id = data['doctor_id']
         appointment_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d').date()
         appointment_time = datetime.strptime(data['appointment_time'], '%H:%M').time()
         
-        # Check if appointment date is in the future
-        if appointment_date < date.today():
-            return jsonify({'error': 'Cannot book appointments in the past'}), 400
-        
-        # Check if doctor is available at that time
-        existing_appointment = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date == appointment_date,
-            Appointment.appointment_time == appointment_time,
-            Appointment.status == 'Booked'
-        ).first()
-        
-        if existing_appointment:
-            return jsonify({'error': 'Doctor is not available at this time'}), 400
-        
-        # Create appointment
-        appointment = Appointment(
-            patient_id=patient.id,
-            doctor_id=doctor_id,
-            appointment_date=appointment_date,
-            appointment_time=appointment_time,
-            reason=data.get('reason'),
-            status='Booked'
-        )
-        db.session.add(appointment)
-        db.session.commit()
+        try:
+            appointment = book_slot(
+                patient_id,
+                data['doctor_id'],
+                appointment_date,
+                appointment_time,
+                reason=data.get('reason')
+            )
+        except BookingError as e:
+            return jsonify({'error': str(e)}), e.status_code
         
         return jsonify({
             'message': 'Appointment booked successfully',
@@ -303,18 +236,13 @@ def book_appointment():
 def reschedule_appointment(appointment_id):
     """Reschedule an appointment"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        patient = Patient.query.filter_by(user_id=user_id).first()
+        patient_id = g.patient_id
         
         appointment = Appointment.query.get(appointment_id)
         if not appointment:
             return jsonify({'error': 'Appointment not found'}), 404
         
-        if appointment.patient_id != patient.id:
+        if appointment.patient_id != patient_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
         if appointment.status != 'Booked':
@@ -322,31 +250,18 @@ def reschedule_appointment(appointment_id):
         
         data = request.get_json()
         
+        new_date = appointment.appointment_date
+        new_time = appointment.appointment_time
         if 'appointment_date' in data:
             new_date = datetime.strptime(data['appointment_date'], '%Y-%m-%d').date()
-            if new_date < date.today():
-                return jsonify({'error': 'Cannot reschedule to a past date'}), 400
-            appointment.appointment_date = new_date
-        
         if 'appointment_time' in data:
             new_time = datetime.strptime(data['appointment_time'], '%H:%M').time()
-            
-            # Check for conflicts
-            conflict = Appointment.query.filter(
-                Appointment.id != appointment_id,
-                Appointment.doctor_id == appointment.doctor_id,
-                Appointment.appointment_date == appointment.appointment_date,
-                Appointment.appointment_time == new_time,
-                Appointment.status == 'Booked'
-            ).first()
-            
-            if conflict:
-                return jsonify({'error': 'Doctor is not available at this time'}), 400
-            
-            appointment.appointment_time = new_time
         
         appointment.updated_at = datetime.utcnow()
-        db.session.commit()
+        try:
+            move_slot(appointment, new_date, new_time)
+        except BookingError as e:
+            return jsonify({'error': str(e)}), e.status_code
         
         return jsonify({'message': 'Appointment rescheduled successfully'}), 200
         
@@ -359,18 +274,13 @@ def reschedule_appointment(appointment_id):
 def cancel_appointment(appointment_id):
     """Cancel an appointment"""
     try:
-        user_id = get_jwt_identity()
-        try:
-            user_id = int(user_id)
-        except Exception:
-            pass
-        patient = Patient.query.filter_by(user_id=user_id).first()
+        patient_id = g.patient_id
         
         appointment = Appointment.query.get(appointment_id)
         if not appointment:
             return jsonify({'error': 'Appointment not found'}), 404
         
-        if appointment.patient_id != patient.id:
+        if appointment.patient_id != patient_id:
             return jsonify({'error': 'Unauthorized'}), 403
         
         appointment.status = 'Cancelled'
@@ -388,34 +298,26 @@ def cancel_appointment(appointment_id):
 def get_treatment_history():
     """Get patient's treatment history"""
     try:
-        user_id = get_jwt_identity()
-        patient = Patient.query.filter_by(user_id=user_id).first()
+        patient_id = g.patient_id
         
-        if not patient:
-            return jsonify({'error': 'Patient profile not found'}), 404
-        
-        # Get all completed appointments with treatments
-        appointments = Appointment.query.filter(
-            Appointment.patient_id == patient.id,
+        # Completed appointments that have a treatment record
+        query = appointment_query().join(Appointment.treatment).filter(
+            Appointment.patient_id == patient_id,
             Appointment.status == 'Completed'
-        ).order_by(Appointment.appointment_date.desc()).all()
-        
-        history = []
-        for apt in appointments:
-            if apt.treatment:
-                history.append({
-                    'appointment_id': apt.id,
-                    'doctor_name': apt.doctor.name,
-                    'specialization': apt.doctor.specialization,
-                    'appointment_date': apt.appointment_date.isoformat(),
-                    'appointment_time': apt.appointment_time.strftime('%H:%M'),
-                    'diagnosis': apt.treatment.diagnosis,
-                    'prescription': apt.treatment.prescription,
-                    'notes': apt.treatment.notes,
-                    'next_visit': apt.treatment.next_visit.isoformat() if apt.treatment.next_visit else None
-                })
-        
-        return jsonify(history), 200
+        )
+        
+        keys = [Appointment.appointment_date, Appointment.appointment_time, Appointment.id]
+        return paginated(query, keys, lambda apt: {
+            'appointment_id': apt.id,
+            'doctor_name': apt.doctor.name,
+            'specialization': apt.doctor.specialization,
+            'appointment_date': apt.appointment_date.isoformat(),
+            'appointment_time': apt.appointment_time.strftime('%H:%M'),
+            'diagnosis': apt.treatment.diagnosis,
+            'prescription': apt.treatment.prescription,
+            'notes': apt.treatment.notes,
+            'next_visit': apt.treatment.next_visit.isoformat() if apt.treatment.next_visit else None
+        }, descending=True)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -423,49 +325,24 @@ def get_treatment_history():
 @patient_bp.route('/export-treatments', methods=['GET'])
 @require_patient
 def export_treatments():
-    """Export treatment history as CSV"""
+    """Stream treatment history as a CSV download (gzip-encoded when the client accepts it)"""
     try:
-        user_id = get_jwt_identity()
-        patient = Patient.query.filter_by(user_id=user_id).first()
+        patient = Patient.query.get(g.patient_id)
         
         if not patient:
             return jsonify({'error': 'Patient profile not found'}), 404
         
-        # Get all completed appointments with treatments
-        appointments = Appointment.query.filter(
-            Appointment.patient_id == patient.id,
-            Appointment.status == 'Completed'
-        ).order_by(Appointment.appointment_date.desc()).all()
-        
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'Patient ID', 'Patient Name', 'Doctor Name', 'Appointment Date',
-            'Diagnosis', 'Treatment', 'Next Visit Suggested'
-        ])
-        
-        # Write data
-        for apt in appointments:
-            if apt.treatment:
-                writer.writerow([
-                    patient.id,
-                    patient.name,
-                    apt.doctor.name,
-                    apt.appointment_date.isoformat(),
-                    apt.treatment.diagnosis or '',
-                    apt.treatment.prescription or '',
-                    apt.treatment.next_visit.isoformat() if apt.treatment.next_visit else ''
-                ])
-        
-        # Create response
-        output.seek(0)
-        return jsonify({
-            'message': 'Export ready',
-            'csv_data': output.getvalue()
-        }), 200
+        chunks = iter_treatment_csv(patient)
+        headers = {
+            'Content-Disposition': 'attachment; filename=treatment_history.csv',
+            'Vary': 'Accept-Encoding'
+        }
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            chunks = gzip_chunks(chunks)
+            headers['Content-Encoding'] = 'gzip'
+        
+        # Rows are fetched and written in chunks while the response is sent
+        return Response(stream_with_context(chunks), mimetype='text/csv', headers=headers)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -476,11 +353,8 @@ def export_treatments():
 def export_treatments_async():
     """Trigger async CSV export via Celery and return task id."""
     try:
-        user_id = get_jwt_identity()
-        patient = Patient.query.filter_by(user_id=user_id).first()
-        if not patient:
-            return jsonify({'error': 'Patient profile not found'}), 404
-        task = export_patient_treatments.delay(patient.id)
+        patient_id = g.patient_id
+        task = export_patient_treatments.delay(patient_id)
         return jsonify({'task_id': task.id}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -489,7 +363,7 @@ def export_treatments_async():
 @patient_bp.route('/export-treatments/status/<task_id>', methods=['GET'])
 @require_patient
 def export_treatments_status(task_id):
-    """Check status of async CSV export; return CSV when ready."""
+    """Check status of async CSV export; return the download link when ready."""
     try:
         result = AsyncResult(task_id, app=celery)
         response = {
@@ -498,22 +372,64 @@ def export_treatments_status(task_id):
             'ready': result.ready()
         }
         if result.ready():
-            # CSV string result
-            response['csv_data'] = result.get() or ''
+            if not result.successful():
+                response['error'] = 'Export failed'
+                return jsonify(response), 200
+            artifact = result.result
+            if not isinstance(artifact, dict) or artifact.get('patient_id') != g.patient_id:
+                return jsonify({'error': 'Export not found'}), 404
+            response['artifact'] = {
+                'filename': artifact['filename'],
+                'size': artifact['size'],
+                'created_at': artifact['created_at']
+            }
+            response['download_url'] = f'/api/patient/export-treatments/download/{task_id}'
         return jsonify(response), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+
+@patient_bp.route('/export-treatments/download/<task_id>', methods=['GET'])
+@require_patient
+def download_export(task_id):
+    """Download a finished async export (supports Range requests)"""
+    try:
+        meta = load_artifact_meta(task_id)
+        if not meta or meta.get('patient_id') != g.patient_id:
+            return jsonify({'error': 'Export not found or expired'}), 404
+        
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            # Serve the stored gzip bytes as-is; Range offsets apply to the compressed body
+            response = send_file(
+                artifact_path(task_id),
+                mimetype='text/csv',
+                as_attachment=True,
+                download_name=meta['filename'],
+                conditional=True
+            )
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            # Clients without gzip get a decompressed copy, so Range offsets match the CSV they receive
+            response = send_file(
+                plain_artifact_path(task_id),
+                mimetype='text/csv',
+                as_attachment=True,
+                download_name=meta['filename'],
+                conditional=True
+            )
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @patient_bp.route('/departments', methods=['GET'])
 @require_patient
+@cached('departments', ttl=86400)
 def get_departments():
     """Get all departments"""
     try:
-        cache_key = 'departments:all'
-        cached = current_app.redis.get(cache_key)
-        if cached:
-            import json as _json
-            return jsonify(_json.loads(cached)), 200
         departments = Department.query.all()
         payload = [{
             'id': dept.id,
@@ -521,8 +437,6 @@ def get_departments():
             'description': dept.description,
             'doctors_count': len([d for d in dept.doctors if d.user.is_active])
         } for dept in departments]
-        import json as _json
-        current_app.redis.setex(cache_key, current_app.config['CACHE_DEFAULT_TIMEOUT'], _json.dumps(payload))
         return jsonify(payload), 200
         
     except Exception as e:
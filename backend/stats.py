@@ -0,0 +1,188 @@
+"""Dashboard counters kept in the stat_counters table
+
+A session hook turns every flushed Doctor, Patient and Appointment change into
+counter deltas and applies them as atomic upserts in the same transaction, so
+the dashboards read a handful of rows instead of counting whole tables.
+rebuild_stats() recomputes everything from the source tables; the nightly
+reconcile task runs it to repair drift (bulk Core inserts, manual SQL) and to
+drop per-date rows that are in the past.
+
+Counters:
+    ('hospital', 0): doctors, patients, appointments
+    ('doctor', doctor_id): patients (distinct), completed_appointments
+    ('date', date ordinal): booked appointments on that date
+
+The distinct-patient count can drift up under concurrency. Two transactions can
+each book the first appointment of the same doctor/patient pair. Under READ
+COMMITTED (PostgreSQL) neither sees the other's row, so both add one. SQLite
+serializes writers, so it is not affected. The nightly reconcile corrects it.
+"""
+from sqlalchemy import event, select, func, delete, update, and_, case, distinct
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import sqlite, postgresql
+from sqlalchemy.orm import Session
+from collections import Counter
+from datetime import date
+
+from models import db, Doctor, Patient, Appointment, StatCounter
+
+HOSPITAL = ('hospital', 0)
+
+_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def _appointment_keys(status, appointment_date, doctor_id):
+    """Counters an appointment in this state contributes one to"""
+    keys = [(*HOSPITAL, 'appointments')]
+    if status == 'Booked':
+        keys.append(('date', appointment_date.toordinal(), 'booked'))
+    elif status == 'Completed':
+        keys.append(('doctor', doctor_id, 'completed_appointments'))
+    return keys
+
+
+def _old_value(state, attr):
+    """Pre-flush value of a column attribute"""
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return state.attrs[attr].value
+
+
+def _collect_deltas(session, flush_context):
+    deltas = Counter()
+    new_pairs = set()
+    new_ids = set()
+    for obj in session.new:
+        if isinstance(obj, Doctor):
+            deltas[(*HOSPITAL, 'doctors')] += 1
+        elif isinstance(obj, Patient):
+            deltas[(*HOSPITAL, 'patients')] += 1
+        elif isinstance(obj, Appointment):
+            for key in _appointment_keys(obj.status or 'Booked', obj.appointment_date, obj.doctor_id):
+                deltas[key] += 1
+            new_pairs.add((obj.doctor_id, obj.patient_id))
+            new_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Doctor):
+            deltas[(*HOSPITAL, 'doctors')] -= 1
+        elif isinstance(obj, Patient):
+            deltas[(*HOSPITAL, 'patients')] -= 1
+        elif isinstance(obj, Appointment):
+            state = db.inspect(obj)
+            old = [_old_value(state, a) for a in ('status', 'appointment_date', 'doctor_id')]
+            for key in _appointment_keys(*old):
+                deltas[key] -= 1
+    for obj in session.dirty:
+        if isinstance(obj, Appointment) and session.is_modified(obj):
+            state = db.inspect(obj)
+            old = [_old_value(state, a) for a in ('status', 'appointment_date', 'doctor_id')]
+            for key in _appointment_keys(*old):
+                deltas[key] -= 1
+            for key in _appointment_keys(obj.status, obj.appointment_date, obj.doctor_id):
+                deltas[key] += 1
+
+    conn = session.connection()
+    # A doctor gains a patient on the pair's first appointment
+    for doctor_id, patient_id in new_pairs:
+        seen = conn.execute(select(Appointment.id).where(
+            Appointment.doctor_id == doctor_id,
+            Appointment.patient_id == patient_id,
+            Appointment.id.notin_(new_ids)
+        ).limit(1)).first()
+        if seen is None:
+            deltas[('doctor', doctor_id, 'patients')] += 1
+
+    apply_deltas(conn, deltas)
+
+
+def apply_deltas(conn, deltas):
+    """Add deltas ({(scope, scope_id, name): n}) to the counters with one upsert"""
+    rows = [
+        {'scope': scope, 'scope_id': scope_id, 'name': name, 'value': n}
+        for (scope, scope_id, name), n in deltas.items() if n
+    ]
+    if not rows:
+        return
+    insert = _INSERTS.get(conn.dialect.name)
+    if insert is None:
+        _apply_deltas_portable(conn, rows)
+        return
+    stmt = insert(StatCounter.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['scope', 'scope_id', 'name'],
+        set_={'value': StatCounter.__table__.c.value + stmt.excluded.value}
+    )
+    conn.execute(stmt, rows)
+
+
+def _apply_deltas_portable(conn, rows):
+    """Row-by-row update-or-insert for dialects without an upsert we know how to build"""
+    table = StatCounter.__table__
+    for row in rows:
+        matches = and_(table.c.scope == row['scope'], table.c.scope_id == row['scope_id'], table.c.name == row['name'])
+        increment = update(table).where(matches).values(value=table.c.value + row['value'])
+        if conn.execute(increment).rowcount:
+            continue
+        try:
+            # Savepoint: a concurrent insert of the same counter must not abort the transaction
+            with conn.begin_nested():
+                conn.execute(table.insert(), row)
+        except IntegrityError:
+            conn.execute(increment)
+
+
+def rebuild_stats(conn):
+    """Recompute every counter from the source tables; returns the number of rows written"""
+    rows = []
+    for name, model in (('doctors', Doctor), ('patients', Patient), ('appointments', Appointment)):
+        rows.append((*HOSPITAL, name, conn.execute(select(func.count()).select_from(model)).scalar()))
+    per_doctor = conn.execute(select(
+        Appointment.doctor_id,
+        func.count(distinct(Appointment.patient_id)),
+        func.sum(case((Appointment.status == 'Completed', 1), else_=0))
+    ).group_by(Appointment.doctor_id))
+    for doctor_id, patients, completed in per_doctor:
+        rows.append(('doctor', doctor_id, 'patients', patients))
+        rows.append(('doctor', doctor_id, 'completed_appointments', completed or 0))
+    booked = conn.execute(select(
+        Appointment.appointment_date, func.count()
+    ).where(
+        Appointment.status == 'Booked',
+        Appointment.appointment_date >= date.today()
+    ).group_by(Appointment.appointment_date))
+    for appointment_date, count in booked:
+        rows.append(('date', appointment_date.toordinal(), 'booked', count))
+
+    conn.execute(delete(StatCounter.__table__))
+    rows = [
+        {'scope': scope, 'scope_id': scope_id, 'name': name, 'value': value}
+        for scope, scope_id, name, value in rows if value
+    ]
+    if rows:
+        conn.execute(StatCounter.__table__.insert(), rows)
+    return len(rows)
+
+
+def read_counters(scope, scope_id):
+    """All counters of one scope as {name: value}"""
+    rows = db.session.execute(select(StatCounter.name, StatCounter.value).where(
+        StatCounter.scope == scope, StatCounter.scope_id == scope_id
+    ))
+    return dict(rows.all())
+
+
+def booked_between(start, end=None):
+    """Booked appointments dated from start (inclusive) to end (inclusive, open if None)"""
+    conditions = [StatCounter.scope == 'date', StatCounter.scope_id >= start.toordinal()]
+    if end is not None:
+        conditions.append(StatCounter.scope_id <= end.toordinal())
+    return db.session.execute(select(func.coalesce(func.sum(StatCounter.value), 0)).where(
+        and_(*conditions)
+    )).scalar()
+
+
+def register_stats_listeners():
+    """Install the flush hook that keeps stat_counters in step with the source tables"""
+    if not event.contains(Session, 'after_flush', _collect_deltas):
+        event.listen(Session, 'after_flush', _collect_deltas)
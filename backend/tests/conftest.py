@@ -0,0 +1,71 @@
+"""Shared fixtures: a fresh SQLite database per test and an in-memory Redis stand-in (see support.py)"""
+from collections import Counter
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import Config
+from tests.support import (
+    FakeRedis, StatementCounter, TEST_HASH_METHOD,
+    add_appointments as add_appointments_to, seed as seed_accounts
+)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setattr(Config, 'PASSWORD_HASH_METHOD', TEST_HASH_METHOD)
+    from app import create_app, setup_database
+    import cache
+    import directory
+    monkeypatch.setattr(directory, '_snapshot', None)
+    # A fresh L1 per test, as if each test ran in a new process
+    monkeypatch.setattr(cache, '_local_pid', None)
+    monkeypatch.setattr(cache, '_subscribed', threading.Event())
+    monkeypatch.setattr(cache, '_stats', Counter())
+    app = create_app()
+    app.config['TESTING'] = True
+    app.redis = FakeRedis()
+    with app.app_context():
+        setup_database()
+        yield app
+        from models import db
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def login(client):
+    def login(username, password='pw'):
+        response = client.post('/api/auth/login', json={'username': username, 'password': password})
+        assert response.status_code == 200, response.get_json()
+        return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    return login
+
+
+@pytest.fixture
+def count_statements(app):
+    from models import db
+    return lambda: StatementCounter(db.engine)
+
+
+@pytest.fixture
+def add_appointments(app):
+    """add_appointments(doctor_ids, patient_ids, n, start=0): n appointments cycling through statuses and slots"""
+    return add_appointments_to
+
+
+@pytest.fixture
+def seed(app):
+    """seed(doctors, patients, appointments) -> (doctor ids, patient ids); users doc<i> / pat<i>, password 'pw'"""
+    return seed_accounts
@@ -0,0 +1,292 @@
+"""Helpers shared by the test suite and the benchmarks
+
+An in-memory Redis stand-in, a SQL statement counter and account/appointment
+seeding. Everything here needs the backend directory on sys.path; the seeding
+functions also need an app context.
+"""
+from datetime import date, time, timedelta
+import queue
+import threading
+
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+# Cheap hashes keep logins fast; production uses scrypt
+TEST_HASH_METHOD = 'pbkdf2:sha256:1000'
+
+
+class FakeRedis:
+    """Just enough of redis-py for the app: strings, sets, sorted sets, pub/sub, pipelines and the Lua scripts
+
+    One instance stands for one Redis server: processes sharing a server share the instance.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.subscribers = {}  # channel -> FakePubSub objects subscribed to it
+        self._subscribers_lock = threading.Lock()
+
+    @staticmethod
+    def _key(key):
+        return key.decode() if isinstance(key, bytes) else key
+
+    @staticmethod
+    def _bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def get(self, key):
+        return self.data.get(self._key(key))
+
+    def mget(self, keys, *args):
+        keys = [keys, *args] if isinstance(keys, (str, bytes)) else [*keys, *args]
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        key = self._key(key)
+        if nx and key in self.data:
+            return None
+        self.data[key] = self._bytes(value)
+        return True
+
+    def setex(self, key, seconds, value):
+        return self.set(key, value)
+
+    def delete(self, *keys):
+        return sum(1 for key in keys if self.data.pop(self._key(key), None) is not None)
+
+    def exists(self, *keys):
+        return sum(1 for key in keys if self._key(key) in self.data)
+
+    def expire(self, key, seconds):
+        return self._key(key) in self.data
+
+    def incr(self, key):
+        value = int(self.get(key) or 0) + 1
+        self.data[self._key(key)] = self._bytes(value)
+        return value
+
+    def sadd(self, key, *members):
+        members = {self._bytes(m) for m in members}
+        self.data.setdefault(self._key(key), set()).update(members)
+        return len(members)
+
+    def smembers(self, key):
+        return set(self.data.get(self._key(key), ()))
+
+    def zadd(self, key, mapping):
+        self.data.setdefault(self._key(key), {}).update(
+            {self._bytes(member): float(score) for member, score in mapping.items()}
+        )
+        return len(mapping)
+
+    def _zsorted(self, key):
+        return sorted(self.data.get(self._key(key), {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zrange(self, key, start, stop, withscores=False):
+        items = self._zsorted(key)[start:None if stop == -1 else stop + 1]
+        return items if withscores else [member for member, _ in items]
+
+    def zrangebyscore(self, key, low, high, withscores=False):
+        low = str(low)
+        exclusive = low.startswith('(')
+        low = float(low.lstrip('('))
+        items = [
+            (member, score) for member, score in self._zsorted(key)
+            if (score > low if exclusive else score >= low) and score <= float(high)
+        ]
+        return items if withscores else [member for member, _ in items]
+
+    def zremrangebyrank(self, key, start, stop):
+        items = self._zsorted(key)
+        start, stop = (i if i >= 0 else len(items) + i for i in (start, stop))
+        for member, _ in items[max(start, 0):stop + 1]:
+            del self.data[self._key(key)][member]
+        return 0
+
+    def publish(self, channel, message):
+        with self._subscribers_lock:
+            receivers = list(self.subscribers.get(self._key(channel), ()))
+        for pubsub in receivers:
+            pubsub.deliver(self._bytes(channel), self._bytes(message))
+        return len(receivers)
+
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self, ignore_subscribe_messages)
+
+    def flushall(self):
+        self.data.clear()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, source):
+        return FakeScript(self, source)
+
+
+class FakePubSub:
+    """A subscription; listen() blocks until the next published message"""
+
+    def __init__(self, redis, ignore_subscribe_messages=False):
+        self.redis = redis
+        self.ignore_subscribe_messages = ignore_subscribe_messages
+        self.messages = queue.Queue()
+
+    def subscribe(self, *channels):
+        with self.redis._subscribers_lock:
+            for channel in channels:
+                subscribers = self.redis.subscribers.setdefault(self.redis._key(channel), [])
+                subscribers.append(self)
+                if not self.ignore_subscribe_messages:
+                    self.messages.put({'type': 'subscribe', 'pattern': None,
+                                       'channel': self.redis._bytes(channel), 'data': len(subscribers)})
+
+    def unsubscribe(self, *channels):
+        with self.redis._subscribers_lock:
+            for channel, subscribers in self.redis.subscribers.items():
+                if (not channels or channel in map(self.redis._key, channels)) and self in subscribers:
+                    subscribers.remove(self)
+
+    def deliver(self, channel, data):
+        self.messages.put({'type': 'message', 'pattern': None, 'channel': channel, 'data': data})
+
+    def get_message(self, timeout=0.0):
+        try:
+            return self.messages.get(timeout=timeout) if timeout else self.messages.get_nowait()
+        except queue.Empty:
+            return None
+
+    def listen(self):
+        while True:
+            yield self.messages.get()
+
+    def close(self):
+        self.unsubscribe()
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((getattr(self.redis, name), args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        calls, self.calls = self.calls, []
+        return [fn(*args, **kwargs) for fn, args, kwargs in calls]
+
+
+class FakeScript:
+    """Runs the Python equivalent of one of the app's Lua scripts"""
+
+    def __init__(self, redis, source):
+        self.redis = redis
+        self.source = source
+
+    def __call__(self, keys=(), args=(), client=None):
+        if client is not None and client is not self.redis:
+            client.calls.append((self._run, (keys, args), {}))
+            return client
+        return self._run(keys, args)
+
+    def _run(self, keys, args):
+        import cache
+        import directory
+        if self.source == directory._MARK_CHANGED_SCRIPT:
+            version = self.redis.incr(keys[0])
+            self.redis.zadd(keys[1], {args[0]: version})
+            self.redis.zremrangebyrank(keys[1], 0, -int(args[1]) - 1)
+            return version
+        if self.source == cache._STORE_SCRIPT:
+            n = (len(keys) - 1) // 2
+            if [self.redis.get(key) or b'' for key in keys[1:1 + n]] != [self.redis._bytes(a) for a in args[2:]]:
+                return 0
+            self.redis.setex(keys[0], args[0], args[1])
+            for tag_set in keys[1 + n:]:
+                self.redis.sadd(tag_set, keys[0])
+            return 1
+        if self.source == cache._RELEASE_LOCK_SCRIPT:
+            if self.redis.get(keys[0]) != self.redis._bytes(args[0]):
+                return 0
+            return self.redis.delete(keys[0])
+        if self.source == cache._INVALIDATE_SCRIPT:
+            removed = 0
+            for tag in keys:
+                removed += self.redis.delete(*self.redis.smembers(tag))
+                self.redis.delete(tag)
+            return removed
+        raise NotImplementedError('No fake for this script')
+
+
+class StatementCounter:
+    """Counts SQL statements sent to the primary engine"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+
+    def __len__(self):
+        return len(self.statements)
+
+
+def add_appointments(doctor_ids, patient_ids, n, start=0):
+    """Add n appointments cycling through statuses and slots; needs an app context"""
+    from models import db, Appointment, Treatment
+    today = date.today()
+    for i in range(start, start + n):
+        status = ('Booked', 'Completed', 'Cancelled')[i % 3]
+        # Each doctor sees every patient; slots are unique per doctor
+        slot = i // len(doctor_ids)
+        appointment = Appointment(
+            doctor_id=doctor_ids[i % len(doctor_ids)],
+            patient_id=patient_ids[slot % len(patient_ids)],
+            appointment_date=today + timedelta(days=slot % 7),
+            appointment_time=time(8 + (slot // 7) // 60 % 10, (slot // 7) % 60),
+            status=status
+        )
+        if status == 'Completed':
+            appointment.treatment = Treatment(diagnosis='Checkup', prescription='Rest')
+        db.session.add(appointment)
+    db.session.commit()
+
+
+def seed(n_doctors=2, n_patients=3, n_appointments=0):
+    """Create doctors doc<i> and patients pat<i> (password 'pw'); returns (doctor ids, patient ids)"""
+    from models import db, User, Doctor, Patient, DoctorAvailability
+    password = generate_password_hash('pw', method=TEST_HASH_METHOD)
+    doctors, patients = [], []
+    for i in range(n_doctors):
+        user = User(username=f'doc{i}', email=f'doc{i}@example.com', password=password, role='doctor')
+        doctor = Doctor(user=user, department_id=1 + i % 6, name=f'Doctor {i}', specialization='Cardiology')
+        db.session.add(doctor)
+        doctors.append(doctor)
+    for i in range(n_patients):
+        user = User(username=f'pat{i}', email=f'pat{i}@example.com', password=password, role='patient')
+        patient = Patient(user=user, name=f'Patient {i}', phone=f'555{i:04d}')
+        db.session.add(patient)
+        patients.append(patient)
+    db.session.flush()
+    today = date.today()
+    for doctor in doctors:
+        for day in range(8):
+            db.session.add(DoctorAvailability(
+                doctor_id=doctor.id, date=today + timedelta(days=day), start_time=time(8), end_time=time(18)
+            ))
+    db.session.commit()
+    doctor_ids = [doctor.id for doctor in doctors]
+    patient_ids = [patient.id for patient in patients]
+    add_appointments(doctor_ids, patient_ids, n_appointments)
+    return doctor_ids, patient_ids
@@ -0,0 +1,57 @@
+"""Deactivation revokes issued tokens, or fails without changing anything"""
+import time
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from models import db, User, Doctor
+from routes.auth import INACTIVE_USER_KEY
+
+
+@pytest.mark.parametrize('kind, username', [('doctors', 'doc0'), ('patients', 'pat0')])
+def test_deactivation_revokes_existing_tokens(client, login, seed, kind, username):
+    doctor_ids, patient_ids = seed(n_doctors=1, n_patients=1)
+    admin, user = login('admin', 'admin123'), login(username)
+    profile_id = doctor_ids[0] if kind == 'doctors' else patient_ids[0]
+
+    assert client.get('/api/auth/me', headers=user).status_code == 200
+    assert client.delete(f'/api/admin/{kind}/{profile_id}', headers=admin).status_code == 200
+    assert client.get('/api/auth/me', headers=user).status_code == 401
+
+
+@pytest.mark.parametrize('kind, username', [('doctors', 'doc0'), ('patients', 'pat0')])
+def test_deactivation_fails_when_revocation_cannot_be_recorded(app, client, login, seed, monkeypatch, kind, username):
+    doctor_ids, patient_ids = seed(n_doctors=1, n_patients=1)
+    admin, user = login('admin', 'admin123'), login(username)
+    profile_id = doctor_ids[0] if kind == 'doctors' else patient_ids[0]
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError('Redis is down')
+    monkeypatch.setattr(app.redis, 'setex', unavailable)
+
+    response = client.delete(f'/api/admin/{kind}/{profile_id}', headers=admin)
+    assert response.status_code == 503
+    db.session.remove()
+    assert User.query.filter_by(username=username).one().is_active
+    assert client.get('/api/auth/me', headers=user).status_code == 200
+
+
+def test_reactivated_user_can_sign_in_again(app, client, login, seed):
+    doctor_ids, _ = seed(n_doctors=1, n_patients=0)
+    user_id = Doctor.query.get(doctor_ids[0]).user_id
+    # A session from a minute ago; iat has one-second resolution, so keep the events apart
+    old = {'Authorization': 'Bearer ' + create_access_token(
+        identity=str(user_id), additional_claims={'role': 'doctor', 'iat': int(time.time()) - 60}
+    )}
+    assert client.get('/api/auth/me', headers=old).status_code == 200
+    assert client.delete(f'/api/admin/doctors/{doctor_ids[0]}', headers=login('admin', 'admin123')).status_code == 200
+    key = INACTIVE_USER_KEY.format(user_id)
+    app.redis.set(key, int(app.redis.get(key)) - 30)  # deactivated 30 seconds ago
+
+    user = User.query.get(user_id)
+    user.is_active = True
+    db.session.commit()
+
+    assert client.get('/api/auth/me', headers=login('doc0')).status_code == 200
+    # Tokens from before the deactivation stay revoked
+    assert client.get('/api/auth/me', headers=old).status_code == 401
@@ -0,0 +1,18 @@
+"""Every benchmark still runs end to end (at a tiny size; the numbers are not checked)"""
+import importlib
+
+import pytest
+
+
+@pytest.mark.parametrize('module, argv', [
+    ('benchmarks.directory', ['--doctors', '2,4', '--repeat', '2']),
+    ('benchmarks.task_overhead', ['--tasks', '5', '--rebuilds', '1']),
+    ('benchmarks.startup', ['--runs', '1']),
+    ('benchmarks.search', ['--patients', '50', '--repeat', '1']),
+    ('benchmarks.engine_profiles', ['--profiles', 'default,sqlite', '--threads', '2', '--bookings', '2']),
+    ('benchmarks.login', ['--methods', 'pbkdf2:sha256:1000', '--threads', '2', '--logins', '2']),
+])
+def test_benchmark_runs(module, argv, capsys):
+    rows = importlib.import_module(module).main(argv)
+    assert rows
+    assert capsys.readouterr().out.strip()
@@ -0,0 +1,96 @@
+"""Booking engine: a slot is booked at most once, even under concurrent requests"""
+from datetime import date, time, timedelta
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from migrations import run_migrations
+from models import db, Appointment, SchemaMigration
+from models.booking import book_slot
+
+THREADS = 16
+
+
+def test_concurrent_bookings_never_double_book(app, login, seed):
+    doctor_ids, _ = seed(n_doctors=1, n_patients=THREADS)
+    headers = [login(f'pat{i}') for i in range(THREADS)]
+    day = (date.today() + timedelta(days=1)).isoformat()
+    slots = ['09:00', '09:30', '10:00', '10:30', '11:00']
+
+    for slot in slots:
+        barrier = threading.Barrier(THREADS)
+        statuses = [None] * THREADS
+
+        def book(i):
+            client = app.test_client()
+            barrier.wait()
+            statuses[i] = client.post('/api/patient/appointments', headers=headers[i], json={
+                'doctor_id': doctor_ids[0], 'appointment_date': day, 'appointment_time': slot
+            }).status_code
+
+        threads = [threading.Thread(target=book, args=(i,)) for i in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(statuses) == [201] + [409] * (THREADS - 1), slot
+
+    db.session.remove()
+    booked = Appointment.query.filter_by(doctor_id=doctor_ids[0], status='Booked').count()
+    assert booked == len(slots)
+
+
+def test_reschedule_into_a_taken_slot_is_a_409(client, login, seed):
+    doctor_ids, _ = seed(n_doctors=1, n_patients=2)
+    day = (date.today() + timedelta(days=1)).isoformat()
+    later = (date.today() + timedelta(days=2)).isoformat()
+    first, second = login('pat0'), login('pat1')
+    taken = client.post('/api/patient/appointments', headers=first, json={
+        'doctor_id': doctor_ids[0], 'appointment_date': later, 'appointment_time': '09:00'
+    })
+    mine = client.post('/api/patient/appointments', headers=second, json={
+        'doctor_id': doctor_ids[0], 'appointment_date': day, 'appointment_time': '09:00'
+    })
+    assert taken.status_code == mine.status_code == 201
+
+    # Only the date changes: the slot check must still apply
+    moved = client.put(f"/api/patient/appointments/{mine.get_json()['appointment']['id']}", headers=second, json={
+        'appointment_date': later, 'appointment_time': '09:00'
+    })
+    assert moved.status_code == 409
+
+
+def test_unique_slot_migration_resolves_existing_double_bookings(app, seed):
+    doctor_ids, patient_ids = seed(n_doctors=1, n_patients=3)
+    # A database from before migration 2, already holding a double (and triple) booking
+    db.session.execute(text('DROP INDEX ux_appointments_booked_slot'))
+    SchemaMigration.query.filter_by(version=2).delete()
+    day = date.today() + timedelta(days=1)
+    for patient_id in patient_ids:
+        db.session.add(Appointment(doctor_id=doctor_ids[0], patient_id=patient_id,
+                                   appointment_date=day, appointment_time=time(9), status='Booked'))
+    db.session.add(Appointment(doctor_id=doctor_ids[0], patient_id=patient_ids[0],
+                               appointment_date=day, appointment_time=time(10), status='Booked'))
+    db.session.commit()
+
+    assert run_migrations() == [2]
+
+    slot = Appointment.query.filter_by(appointment_time=time(9)).order_by(Appointment.id).all()
+    assert [apt.status for apt in slot] == ['Booked', 'Cancelled', 'Cancelled']
+    assert Appointment.query.filter_by(appointment_time=time(10)).one().status == 'Booked'
+    index = db.session.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name = 'ux_appointments_booked_slot'"
+    )).scalar()
+    assert index == 'ux_appointments_booked_slot'
+
+
+def test_other_integrity_errors_are_not_reported_as_taken_slots(app, seed):
+    doctor_ids, _ = seed(n_doctors=1, n_patients=1)
+    day = date.today() + timedelta(days=1)
+    # NOT NULL violation on patient_id: a bug, not a booking conflict
+    with pytest.raises(IntegrityError):
+        book_slot(None, doctor_ids[0], day, time(9))
+    assert Appointment.query.count() == 0
@@ -0,0 +1,174 @@
+"""Response cache: recompute locks, tag invalidation and ETag revalidation"""
+import time
+
+from sqlalchemy import event
+
+import cache
+from models import db, Patient
+
+DEPARTMENTS_KEY = 'cache:departments:patient:-'
+
+
+def test_cold_fill_keeps_a_lock_held_by_another_worker(app, client, login, seed, monkeypatch):
+    seed(n_doctors=1, n_patients=1)
+    headers = login('pat0')
+    monkeypatch.setattr(cache, 'COLD_WAIT', 0.1)
+    # Another worker is still computing this key
+    app.redis.set(f'{DEPARTMENTS_KEY}:lock', 'other-worker')
+
+    response = client.get('/api/patient/departments', headers=headers)
+
+    assert response.status_code == 200
+    assert app.redis.get(DEPARTMENTS_KEY) is not None
+    assert app.redis.get(f'{DEPARTMENTS_KEY}:lock') == b'other-worker'
+
+
+def test_cold_fill_releases_its_own_lock(app, client, login, seed):
+    seed(n_doctors=1, n_patients=1)
+    response = client.get('/api/patient/departments', headers=login('pat0'))
+    assert response.status_code == 200
+    assert app.redis.get(DEPARTMENTS_KEY) is not None
+    assert app.redis.get(f'{DEPARTMENTS_KEY}:lock') is None
+
+
+def _dashboard(client, url, headers):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_dashboards_follow_doctor_and_patient_changes(app, client, login, seed, add_appointments):
+    doctor_ids, patient_ids = seed(n_doctors=1, n_patients=1)
+    add_appointments(doctor_ids, patient_ids, 1)  # booked for today
+    doctor, patient, admin = login('doc0'), login('pat0'), login('admin', 'admin123')
+    patient_view = _dashboard(client, '/api/patient/dashboard', patient)
+    assert patient_view['upcoming_appointments'][0]['doctor_name'] == 'Doctor 0'
+    department = patient_view['departments'][0]
+
+    # Doctor changes reach patient dashboards
+    client.put(f'/api/admin/doctors/{doctor_ids[0]}', headers=admin, json={'name': 'Doctor Renamed'})
+    patient_view = _dashboard(client, '/api/patient/dashboard', patient)
+    assert patient_view['upcoming_appointments'][0]['doctor_name'] == 'Doctor Renamed'
+    created = client.post('/api/admin/doctors', headers=admin, json={
+        'username': 'newdoc', 'email': 'newdoc@example.com', 'password': 'pw',
+        'name': 'New Doctor', 'specialization': 'Cardiology', 'department_id': department['id']
+    })
+    assert created.status_code == 201, created.get_json()
+    patient_view = _dashboard(client, '/api/patient/dashboard', patient)
+    assert patient_view['departments'][0]['doctors_count'] == department['doctors_count'] + 1
+
+    # Patient changes reach doctor dashboards
+    doctor_view = _dashboard(client, '/api/doctor/dashboard', doctor)
+    assert doctor_view['upcoming_appointments'][0]['patient_name'] == 'Patient 0'
+    client.put(f'/api/admin/patients/{patient_ids[0]}', headers=admin, json={'name': 'Patient Renamed'})
+    doctor_view = _dashboard(client, '/api/doctor/dashboard', doctor)
+    assert doctor_view['upcoming_appointments'][0]['patient_name'] == 'Patient Renamed'
+
+
+def test_patient_dashboard_follows_an_email_change(app, client, login, seed):
+    _, patient_ids = seed(n_doctors=1, n_patients=1)
+    patient = login('pat0')
+    assert _dashboard(client, '/api/patient/dashboard', patient)['patient_info']['email'] == 'pat0@example.com'
+    user = Patient.query.get(patient_ids[0]).user
+    user.email = 'renamed@example.com'
+    db.session.commit()
+    assert _dashboard(client, '/api/patient/dashboard', patient)['patient_info']['email'] == 'renamed@example.com'
+
+
+def test_response_computed_across_an_invalidation_is_not_stored(app, client, login, seed):
+    seed(n_doctors=1, n_patients=1)
+    headers = login('pat0')
+    invalidated = []
+
+    def invalidate_once(*args):
+        # A write commits on another worker while this request is reading
+        if not invalidated:
+            invalidated.append(True)
+            cache.invalidate('departments')
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', invalidate_once)
+    try:
+        assert client.get('/api/patient/departments', headers=headers).status_code == 200
+    finally:
+        event.remove(engine, 'before_cursor_execute', invalidate_once)
+
+    assert invalidated
+    assert app.redis.get(DEPARTMENTS_KEY) is None
+    assert app.redis.get(f'{DEPARTMENTS_KEY}:lock') is None
+    # The next request fills the key as usual
+    assert client.get('/api/patient/departments', headers=headers).status_code == 200
+    assert app.redis.get(DEPARTMENTS_KEY) is not None
+
+
+def test_invalidation_published_by_another_process_evicts_the_local_copy(app, client, login, seed, monkeypatch):
+    seed(n_doctors=1, n_patients=1)
+    headers = login('pat0')
+    local = cache._local_cache()
+    assert cache._subscribed.wait(2)
+    assert client.get('/api/patient/departments', headers=headers).status_code == 200
+    assert client.get('/api/patient/departments', headers=headers).status_code == 200
+    assert cache.cache_stats()['l1']['hits'] == 1
+    local.set('cache:other:patient:-', time.time() + 60, 200, b'{}', 'etag', ('other',))
+
+    # Another worker shares the Redis server but not this process's L1
+    with monkeypatch.context() as m:
+        m.setattr(cache, '_local', None)
+        cache.invalidate('departments')
+    deadline = time.monotonic() + 2
+    while local.get(DEPARTMENTS_KEY) is not None and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert local.get(DEPARTMENTS_KEY) is None
+    assert local.get('cache:other:patient:-') is not None
+    assert client.get('/api/patient/departments', headers=headers).status_code == 200
+    assert cache.cache_stats()['l2']['misses'] == 2
+
+
+def _revalidate(client, url, headers, etag):
+    return client.get(url, headers={**headers, 'If-None-Match': etag})
+
+
+def test_cached_view_etag_revalidates_until_a_write(app, client, login, seed):
+    seed(n_doctors=1, n_patients=1)
+    patient, admin = login('pat0'), login('admin', 'admin123')
+    url = '/api/patient/departments'
+
+    first = client.get(url, headers=patient)
+    etag = first.headers['ETag']
+    assert etag == f'"{cache.body_etag(first.data)}"'
+    assert first.cache_control.private and first.cache_control.no_cache
+
+    not_modified = _revalidate(client, url, patient, etag)
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    assert not_modified.headers['ETag'] == etag
+    assert _revalidate(client, url, patient, '"something-else"').status_code == 200
+
+    created = client.post('/api/admin/doctors', headers=admin, json={
+        'username': 'newdoc', 'email': 'newdoc@example.com', 'password': 'pw',
+        'name': 'New Doctor', 'specialization': 'Cardiology', 'department_id': 1
+    })
+    assert created.status_code == 201, created.get_json()
+
+    changed = _revalidate(client, url, patient, etag)
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    assert changed.get_json()[0]['doctors_count'] == first.get_json()[0]['doctors_count'] + 1
+    assert _revalidate(client, url, patient, changed.headers['ETag']).status_code == 304
+
+
+def test_uncached_view_etag_follows_its_body(client, login, seed):
+    seed(n_doctors=0, n_patients=1)
+    patient = login('pat0')
+    url = '/api/patient/profile'
+
+    etag = client.get(url, headers=patient).headers['ETag']
+    assert _revalidate(client, url, patient, etag).status_code == 304
+
+    assert client.put(url, headers=patient, json={'phone': '5551234'}).status_code == 200
+    changed = _revalidate(client, url, patient, etag)
+    assert changed.status_code == 200
+    assert changed.get_json()['phone'] == '5551234'
+    assert changed.headers['ETag'] != etag
+    assert _revalidate(client, url, patient, changed.headers['ETag']).status_code == 304
@@ -0,0 +1,30 @@
+"""The in-memory doctor directory follows changes published by other workers"""
+import directory
+from directory import VERSION_KEY, CHANGES_KEY, mark_doctor_changed
+
+
+def test_every_version_has_its_change_log_entry(app, seed):
+    doctor_ids, _ = seed(n_doctors=3, n_patients=0)
+    for doctor_id in doctor_ids * 2:
+        mark_doctor_changed(doctor_id)
+    version = int(app.redis.get(VERSION_KEY))
+    assert version == 6
+    # Each doctor is logged under the latest version that changed it
+    logged = dict(app.redis.zrange(CHANGES_KEY, 0, -1, withscores=True))
+    assert logged == {str(doctor_id).encode(): float(version - 2 + i) for i, doctor_id in enumerate(doctor_ids)}
+
+
+def test_doctor_update_reaches_the_patient_directory(app, client, login, seed):
+    doctor_ids, _ = seed(n_doctors=2, n_patients=1)
+    patient, admin = login('pat0'), login('admin', 'admin123')
+    before = client.get('/api/patient/doctors', headers=patient).get_json()
+    assert {doc['name'] for doc in before} == {'Doctor 0', 'Doctor 1'}
+    snapshot = directory._snapshot
+
+    response = client.put(f'/api/admin/doctors/{doctor_ids[0]}', headers=admin, json={'name': 'Doctor Renamed'})
+    assert response.status_code == 200, response.get_json()
+
+    after = client.get('/api/patient/doctors', headers=patient).get_json()
+    assert {doc['name'] for doc in after} == {'Doctor Renamed', 'Doctor 1'}
+    # Refreshed from the change log, not rebuilt: the untouched record is reused
+    assert directory._snapshot.records[doctor_ids[1]] is snapshot.records[doctor_ids[1]]
@@ -0,0 +1,57 @@
+"""Each engine is tuned for its own database, including binds that differ from the primary"""
+from sqlalchemy import create_engine, text
+
+from config.config import Config
+from config.engine_profiles import bind_options, engine_options, install_engine_events
+
+
+def _config(**overrides):
+    return {**{key: value for key, value in vars(Config).items() if key.isupper()}, **overrides}
+
+
+def _journal_mode(engine):
+    with engine.connect() as conn:
+        return conn.execute(text('PRAGMA journal_mode')).scalar()
+
+
+def test_sqlite_replica_of_a_postgresql_primary_gets_the_sqlite_profile(tmp_path):
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+    config = _config(SQLALCHEMY_DATABASE_URI='postgresql://hms@db/hms', SQLALCHEMY_BINDS={'replica': replica_url})
+
+    assert 'pool_size' in engine_options(config)
+    assert bind_options(config) == {'replica': {'url': replica_url, 'connect_args': {'timeout': 5.0}}}
+
+    engine = create_engine(replica_url)
+    install_engine_events(engine, config)
+    try:
+        assert _journal_mode(engine) == 'wal'
+    finally:
+        engine.dispose()
+
+
+def test_postgresql_bind_of_a_sqlite_primary_gets_the_postgresql_profile(tmp_path):
+    config = _config(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'primary.db'}",
+        SQLALCHEMY_BINDS={'replica': {'url': 'postgresql://hms@replica/hms', 'pool_size': 2}},
+    )
+    options = bind_options(config)['replica']
+    assert options['pool_size'] == 2  # given for the bind, so it wins
+    assert options['pool_pre_ping'] and 'statement_timeout' in options['connect_args']['options']
+    assert engine_options(config)['connect_args'] == {'timeout': 5.0}
+
+
+def test_app_engines_get_the_profile_of_their_own_url(tmp_path, monkeypatch):
+    from app import create_app
+    from models import db
+    monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'primary.db'}")
+    monkeypatch.setattr(Config, 'SQLALCHEMY_BINDS', {'replica': f"sqlite:///{tmp_path / 'replica.db'}"})
+    monkeypatch.setattr(Config, 'DB_PROFILE', None)
+    # init_app registers a metadata per bind key on the shared db; keep 'replica' out of later tests
+    monkeypatch.setattr(db, 'metadatas', dict(db.metadatas))
+    app = create_app()
+    with app.app_context():
+        try:
+            assert {key: _journal_mode(engine) for key, engine in db.engines.items()} == {None: 'wal', 'replica': 'wal'}
+        finally:
+            for engine in db.engines.values():
+                engine.dispose()
@@ -0,0 +1,82 @@
+"""Exports stream the full CSV, and async downloads honour Range for both the gzip and the plain representation"""
+import gzip
+
+import pytest
+
+from artifacts import save_artifact
+from exports import iter_treatment_csv, gzip_chunks
+from models import db, Appointment, Doctor, Patient
+
+
+def test_download_supports_range_with_and_without_gzip(app, client, login, seed, tmp_path):
+    app.config['EXPORT_DIR'] = str(tmp_path / 'exports')
+    _, patient_ids = seed(n_doctors=2, n_patients=1, n_appointments=30)
+    headers = login('pat0')
+    patient = Patient.query.get(patient_ids[0])
+    save_artifact('task-1', gzip_chunks(iter_treatment_csv(patient)),
+                  patient_id=patient.id, filename='treatment_history.csv', encoding='gzip')
+    url = '/api/patient/export-treatments/download/task-1'
+
+    compressed = client.get(url, headers={**headers, 'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    csv_bytes = gzip.decompress(compressed.data)
+    assert csv_bytes.startswith(b'Patient ID')
+
+    plain = client.get(url, headers=headers)
+    assert plain.status_code == 200
+    assert 'Content-Encoding' not in plain.headers
+    assert plain.data == csv_bytes
+
+    partial = client.get(url, headers={**headers, 'Range': 'bytes=10-49'})
+    assert partial.status_code == 206
+    assert partial.data == csv_bytes[10:50]
+    assert partial.headers['Content-Range'] == f'bytes 10-49/{len(csv_bytes)}'
+
+    partial_gzip = client.get(url, headers={**headers, 'Accept-Encoding': 'gzip', 'Range': 'bytes=0-9'})
+    assert partial_gzip.status_code == 206
+    assert partial_gzip.data == compressed.data[:10]
+
+
+def _expected_csv(patient):
+    rows = db.session.query(Doctor.name, Appointment.appointment_date).join(Appointment.doctor).filter(
+        Appointment.patient_id == patient.id, Appointment.status == 'Completed'
+    ).order_by(Appointment.appointment_date.desc(), Appointment.appointment_time.desc(), Appointment.id.desc())
+    lines = ['Patient ID,Patient Name,Doctor Name,Appointment Date,Diagnosis,Treatment,Next Visit Suggested']
+    lines += [f'{patient.id},{patient.name},{name},{day.isoformat()},Checkup,Rest,' for name, day in rows]
+    return ('\r\n'.join(lines) + '\r\n').encode()
+
+
+@pytest.mark.parametrize('accept_encoding', ['', 'gzip'])
+def test_export_streams_the_complete_csv(client, login, seed, accept_encoding):
+    # Enough completed visits for several 500-row chunks
+    _, patient_ids = seed(n_doctors=2, n_patients=1, n_appointments=1600)
+    expected = _expected_csv(Patient.query.get(patient_ids[0]))
+    assert expected.count(b'\r\n') > 500
+    db.session.remove()
+
+    response = client.get('/api/patient/export-treatments', buffered=False,
+                          headers={**login('pat0'), 'Accept-Encoding': accept_encoding})
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert 'Content-Length' not in response.headers
+    chunks = list(response.iter_encoded())
+    response.close()
+    assert len([chunk for chunk in chunks if chunk]) > 1
+
+    body = b''.join(chunks)
+    if accept_encoding:
+        assert response.headers['Content-Encoding'] == 'gzip'
+        body = gzip.decompress(body)
+    else:
+        assert 'Content-Encoding' not in response.headers
+    assert body == expected
+
+
+def test_download_rejects_artifacts_without_an_owner(app, client, login, seed, tmp_path):
+    app.config['EXPORT_DIR'] = str(tmp_path / 'exports')
+    seed(n_doctors=1, n_patients=1)
+    # Admin uploads and import error reports share the store but belong to no patient
+    save_artifact('upload-1', [b'name,email\n'], filename='patients.csv')
+
+    response = client.get('/api/patient/export-treatments/download/upload-1', headers=login('pat0'))
+    assert response.status_code == 404
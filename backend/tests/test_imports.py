@@ -0,0 +1,52 @@
+"""HTTP bulk imports run on a Celery worker and report through the status endpoint"""
+import io
+
+import pytest
+
+import celery_tasks
+from celery_tasks import celery
+from models import User
+
+
+@pytest.fixture
+def eager_celery(app, monkeypatch, tmp_path):
+    app.config['EXPORT_DIR'] = str(tmp_path / 'artifacts')
+    # Tasks run inside this test's app, not one cached by an earlier test
+    monkeypatch.setattr(celery_tasks, '_flask_app', app)
+    monkeypatch.setitem(celery.conf, 'task_always_eager', True)
+    monkeypatch.setitem(celery.conf, 'task_store_eager_result', True)
+    monkeypatch.setitem(celery.conf, 'result_backend', 'cache+memory://')
+    monkeypatch.delattr(celery._local, 'backend', raising=False)
+    yield
+    monkeypatch.delattr(celery._local, 'backend', raising=False)
+
+
+def test_http_import_runs_as_a_task(app, client, login, eager_celery, tmp_path):
+    headers = login('admin', 'admin123')
+    upload = (
+        'username,email,password,name,phone\n'
+        'imp0,imp0@example.com,pw,Imported 0,5550000\n'
+        'imp1,imp1@example.com,pw,Imported 1,5550001\n'
+        'imp0,dup@example.com,pw,Duplicate,5550002\n'
+    )
+    response = client.post('/api/admin/import/patients', headers=headers,
+                           data={'file': (io.BytesIO(upload.encode()), 'patients.csv')})
+    assert response.status_code == 202, response.get_json()
+    task_id = response.get_json()['task_id']
+    assert response.get_json()['status_url'] == f'/api/admin/import/status/{task_id}'
+
+    status = client.get(f'/api/admin/import/status/{task_id}', headers=headers).get_json()
+    assert status['state'] == 'SUCCESS'
+    assert (status['created'], status['failed']) == (2, 1)
+    assert User.query.filter(User.username.in_(['imp0', 'imp1'])).count() == 2
+
+    report = client.get(status['report_url'], headers=headers)
+    assert report.status_code == 200
+    assert b'Duplicate username in file' in report.data
+    # The upload is removed once the worker has read it
+    assert not [path.name for path in (tmp_path / 'artifacts').iterdir() if path.name.startswith('upload-')]
+
+
+def test_http_import_rejects_unknown_formats(client, login):
+    response = client.post('/api/admin/import/patients?format=xlsx', headers=login('admin', 'admin123'), data=b'')
+    assert response.status_code == 400
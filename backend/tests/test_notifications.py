@@ -0,0 +1,249 @@
+"""Outbound notifications: the pooled webhook dispatcher and the SMTP mailer"""
+from collections import defaultdict
+from datetime import date, time, timedelta
+from email import message_from_string
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import socketserver
+import threading
+import time as clock
+
+import pytest
+
+import notifications
+from notifications import WebhookDispatcher, SMTPMailer
+from celery_tasks import send_monthly_reports
+from models import db, Appointment
+
+
+class WebhookStub(BaseHTTPRequestHandler):
+    """Chat-webhook stand-in; the path picks the behaviour, the JSON body carries a message id"""
+    protocol_version = 'HTTP/1.1'  # keep-alive, so connection pooling is visible
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        server = self.server
+        with server.lock:
+            server.arrivals[self.path].append(clock.monotonic())
+            server.clients.add(self.client_address)
+            server.attempts[body['id']] += 1
+            attempt = server.attempts[body['id']]
+        status, headers = 200, {}
+        if self.path == '/slow':
+            clock.sleep(0.02)
+        elif self.path == '/flaky' and attempt <= 2:
+            status = 503
+        elif self.path == '/throttled' and attempt == 1:
+            status, headers = 429, {'Retry-After': '0.3'}
+        elif self.path == '/throttled-long':
+            status, headers = 429, {'Retry-After': '3600'}
+        elif self.path == '/rejected':
+            status = 400
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def webhook_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookStub)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.arrivals = defaultdict(list)
+    server.attempts = defaultdict(int)
+    server.clients = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _messages(n, prefix='m'):
+    return [(f'{prefix}{i}', {'id': f'{prefix}{i}', 'text': 'Reminder'}) for i in range(n)]
+
+
+def test_webhook_throughput_with_pooled_concurrent_posts(webhook_server):
+    dispatcher = WebhookDispatcher(max_workers=8, rate_per_endpoint=0)
+    start = clock.perf_counter()
+    results = dispatcher.send_all(f'{webhook_server.url}/slow', _messages(200))
+    elapsed = clock.perf_counter() - start
+    dispatcher.close()
+
+    assert [r['id'] for r in results] == [f'm{i}' for i in range(200)]
+    assert all(r['ok'] and r['attempts'] == 1 for r in results)
+    # 200 posts at 20 ms each take 4 s one after another; 8 workers overlap them
+    throughput = len(results) / elapsed
+    assert throughput > 3 * (1 / 0.02), f'{throughput:.0f} messages/s'
+    # Keep-alive connections are reused rather than opened per message
+    assert len(webhook_server.clients) <= 8
+
+
+def test_webhook_rate_limit_per_endpoint(webhook_server):
+    dispatcher = WebhookDispatcher(max_workers=8, rate_per_endpoint=40)
+    results = dispatcher.send_all(f'{webhook_server.url}/ok', _messages(20))
+    dispatcher.close()
+
+    assert all(r['ok'] for r in results)
+    arrivals = sorted(webhook_server.arrivals['/ok'])
+    # 20 messages at 40/s: at least 19 intervals of 25 ms, however many workers
+    assert arrivals[-1] - arrivals[0] >= 19 / 40 * 0.9
+
+
+def test_webhook_retries_and_per_message_results(webhook_server):
+    dispatcher = WebhookDispatcher(max_workers=4, rate_per_endpoint=0, max_retries=3, backoff=0.01,
+                                   max_retry_after=5)
+    url = webhook_server.url
+    flaky = dispatcher.send_all(f'{url}/flaky', _messages(3, 'f'))
+    start = clock.monotonic()
+    throttled = dispatcher.send(f'{url}/throttled', {'id': 't'}, 't')
+    throttled_for = clock.monotonic() - start
+    start = clock.monotonic()
+    parked = dispatcher.send(f'{url}/throttled-long', {'id': 'p'}, 'p')
+    parked_for = clock.monotonic() - start
+    rejected = dispatcher.send(f'{url}/rejected', {'id': 'r'}, 'r')
+    dispatcher.close()
+
+    # 5xx: retried with backoff until it succeeds
+    assert all(r['ok'] and r['attempts'] == 3 and r['status'] == 200 for r in flaky)
+    # 429: the retry waits for Retry-After
+    assert throttled['ok'] and throttled['attempts'] == 2
+    assert throttled_for >= 0.3
+    # A Retry-After beyond the cap fails the message instead of parking the thread
+    assert not parked['ok'] and parked['attempts'] == 1 and parked['status'] == 429
+    assert 'Retry-After' in parked['error']
+    assert parked_for < 1
+    # Other 4xx are not retried
+    assert rejected == {'id': 'r', 'ok': False, 'status': 400, 'attempts': 1, 'error': 'HTTP 400'}
+    assert notifications.summarize(flaky + [throttled, parked, rejected])['failed'] == 2
+
+
+class SMTPStub(socketserver.StreamRequestHandler):
+    """Minimal in-process SMTP server: EHLO, AUTH PLAIN, MAIL, RCPT, DATA, RSET, NOOP, QUIT.
+
+    With server.drop_after set, a connection is cut (no reply, no QUIT) when a
+    transaction starts after that many messages, like a server timing out idle sessions.
+    """
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        delivered = 0
+        recipients = []
+        self.reply('220 localhost stub')
+        while True:
+            line = self.rfile.readline().decode().rstrip('\r\n')
+            if not line:
+                return
+            verb = line.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250-localhost')
+                self.reply('250 AUTH PLAIN')
+            elif verb == 'AUTH':
+                self.reply('235 Authenticated')
+            elif verb == 'MAIL':
+                if server.drop_after is not None and delivered >= server.drop_after:
+                    return  # closes the socket without a reply
+                recipients = []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(line.split(':', 1)[1].strip().strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode()
+                    if data in ('.\r\n', '.\n', ''):
+                        break
+                    lines.append(data[1:] if data.startswith('..') else data)
+                with server.lock:
+                    server.messages.extend((to, ''.join(lines)) for to in recipients)
+                delivered += 1
+                self.reply('250 Queued')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SMTPStub)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = 0
+    server.messages = []
+    server.drop_after = None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _mailer(server, **kwargs):
+    return SMTPMailer('127.0.0.1', server.server_address[1], 'reports@example.com', 'secret', use_tls=False, **kwargs)
+
+
+def test_mailer_reuses_connections_and_reconnects_after_a_drop(smtp_server):
+    smtp_server.drop_after = 2
+    mailer = _mailer(smtp_server, max_connections=2, max_retries=1)
+    messages = [(i, f'user{i}@example.com', 'Report', f'<p>Report {i}</p>') for i in range(8)]
+    try:
+        results = mailer.send_all(messages)
+    finally:
+        mailer.close()
+
+    assert [r['recipient'] for r in results] == [f'user{i}@example.com' for i in range(8)]
+    assert all(r['ok'] for r in results), results
+    # Messages that hit a dropped session were retried once on a new connection
+    assert any(r['attempts'] == 2 for r in results)
+    assert sorted(to for to, _ in smtp_server.messages) == sorted(f'user{i}@example.com' for i in range(8))
+    # Sessions are reused until the server cuts them: at two messages each, not one per message
+    assert 4 <= smtp_server.connections < 8
+
+
+def test_mailer_reports_failures_per_recipient(smtp_server):
+    smtp_server.drop_after = 0  # every session is cut before the first message
+    mailer = _mailer(smtp_server, max_connections=1, max_retries=1)
+    try:
+        results = mailer.send_all([(1, 'a@example.com', 'Report', '<p>a</p>'), (2, None, 'Report', '<p>b</p>')])
+    finally:
+        mailer.close()
+
+    assert [(r['ok'], r['attempts']) for r in results] == [(False, 2), (False, 0)]
+    assert results[1]['error'] == 'No email address'
+    assert smtp_server.messages == []
+
+
+def test_monthly_reports_are_mailed_to_every_doctor(app, seed, smtp_server):
+    doctor_ids, patient_ids = seed(n_doctors=3, n_patients=2)
+    last_month = date.today().replace(day=1) - timedelta(days=1)
+    db.session.add(Appointment(doctor_id=doctor_ids[1], patient_id=patient_ids[0], appointment_date=last_month,
+                               appointment_time=time(9), status='Completed'))
+    db.session.commit()
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=smtp_server.server_address[1], MAIL_USE_TLS=False,
+                      MAIL_USERNAME='reports@example.com', MAIL_PASSWORD='secret', MAIL_MAX_CONNECTIONS=2)
+
+    result = send_monthly_reports.run()
+
+    assert result['reports'] == 3
+    assert result['sent'] == 3 and result['failed'] == 0
+    assert sorted(to for to, _ in smtp_server.messages) == ['doc0@example.com', 'doc1@example.com', 'doc2@example.com']
+    assert smtp_server.connections <= 2
+    report = message_from_string(dict(smtp_server.messages)['doc1@example.com'])
+    assert 'Patient 0' in report.get_payload(decode=True).decode()
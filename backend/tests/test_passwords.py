@@ -0,0 +1,84 @@
+"""Password hashes are upgraded on login, and a full hashing queue answers 503"""
+import threading
+
+import pytest
+
+import passwords
+from models import db, User
+from tests.support import TEST_HASH_METHOD
+
+STRONGER_METHOD = 'pbkdf2:sha256:2000'
+
+
+def test_login_upgrades_a_hash_made_with_old_parameters(app, client, seed):
+    seed(n_doctors=0, n_patients=1)
+    app.config['PASSWORD_HASH_METHOD'] = STRONGER_METHOD
+    assert User.query.filter_by(username='pat0').one().password.startswith(TEST_HASH_METHOD + '$')
+    db.session.remove()
+
+    assert client.post('/api/auth/login', json={'username': 'pat0', 'password': 'pw'}).status_code == 200
+    upgraded = User.query.filter_by(username='pat0').one().password
+    assert upgraded.startswith(STRONGER_METHOD + '$')
+    db.session.remove()
+
+    # The new hash verifies, and is current, so it is kept as is
+    assert client.post('/api/auth/login', json={'username': 'pat0', 'password': 'pw'}).status_code == 200
+    assert User.query.filter_by(username='pat0').one().password == upgraded
+    assert client.post('/api/auth/login', json={'username': 'pat0', 'password': 'wrong'}).status_code == 401
+
+
+@pytest.fixture
+def occupy_hashing(app, monkeypatch):
+    """occupy_hashing() fills a one-worker pool with no queue; it returns a function that frees it"""
+    for name in ('_pool', '_slots', '_pool_pid'):
+        monkeypatch.setattr(passwords, name, getattr(passwords, name))
+    monkeypatch.setattr(passwords, '_pool_pid', None)
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_WORKERS', 1)
+    monkeypatch.setitem(app.config, 'PASSWORD_HASH_QUEUE', 0)
+    started, release = threading.Event(), threading.Event()
+
+    def occupy():
+        started.set()
+        release.wait(5)
+
+    def free():
+        release.set()
+        blocker.join(5)
+        # The slot is given back by a done-callback that may run just after the hash returns
+        assert passwords._slots.acquire(timeout=5)
+        passwords._slots.release()
+
+    def occupy_hashing():
+        nonlocal blocker
+        passwords._executor()
+        blocker = threading.Thread(target=passwords._run, args=(occupy,))
+        blocker.start()
+        assert started.wait(5)
+        return free
+
+    blocker = None
+    yield occupy_hashing
+    release.set()
+
+
+def test_full_hashing_queue_answers_503(client, login, seed, occupy_hashing):
+    seed(n_doctors=0, n_patients=1)
+    admin = login('admin', 'admin123')
+    free = occupy_hashing()
+
+    responses = [
+        client.post('/api/auth/login', json={'username': 'pat0', 'password': 'pw'}),
+        client.post('/api/auth/register', json={
+            'username': 'newpat', 'email': 'newpat@example.com', 'password': 'pw', 'name': 'New', 'phone': '1'
+        }),
+        client.post('/api/admin/doctors', headers=admin, json={
+            'username': 'newdoc', 'email': 'newdoc@example.com', 'password': 'pw',
+            'name': 'New Doctor', 'specialization': 'Cardiology', 'department_id': 1
+        }),
+    ]
+    assert [r.status_code for r in responses] == [503, 503, 503]
+    assert all(r.headers['Retry-After'] == '1' for r in responses)
+    assert User.query.filter(User.username.in_(['newpat', 'newdoc'])).count() == 0
+
+    free()
+    assert client.post('/api/auth/login', json={'username': 'pat0', 'password': 'pw'}).status_code == 200
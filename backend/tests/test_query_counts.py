@@ -0,0 +1,38 @@
+"""List and dashboard endpoints run a fixed number of SQL statements, however many rows they return"""
+import pytest
+
+from models import db
+
+
+def _statements(app, client, count_statements, url, headers):
+    # Measure the view itself, not a cached copy, starting from an empty identity map
+    app.redis.flushall()
+    db.session.remove()
+    with count_statements() as counter:
+        response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return len(counter)
+
+
+@pytest.mark.parametrize('url, username', [
+    ('/api/admin/appointments?all=true', 'admin'),
+    ('/api/admin/appointments', 'admin'),
+    ('/api/doctor/appointments?all=true', 'doc0'),
+    ('/api/doctor/dashboard', 'doc0'),
+    ('/api/patient/dashboard', 'pat0'),
+    ('/api/doctor/patients', 'doc0'),
+    ('/api/doctor/patients?all=true&sort=last_visit&order=desc', 'doc0'),
+])
+def test_list_endpoints_do_not_scale_with_rows(app, client, login, seed, add_appointments, count_statements,
+                                               url, username):
+    doctor_ids, patient_ids = seed(n_doctors=6, n_patients=6)
+    # A few rows between doc0 and pat0, then many across every doctor and patient
+    add_appointments(doctor_ids[:1], patient_ids[:1], 3)
+    headers = login(username, 'admin123' if username == 'admin' else 'pw')
+    few = _statements(app, client, count_statements, url, headers)
+
+    add_appointments(doctor_ids, patient_ids, 144, start=42)
+    many = _statements(app, client, count_statements, url, headers)
+
+    assert many == few
+    assert few <= 6
@@ -0,0 +1,80 @@
+"""EXPLAIN QUERY PLAN guard: hot route queries must use an index, not scan a whole table"""
+from datetime import date, timedelta
+import re
+
+from sqlalchemy import event, text
+
+from models import db
+
+# Tables that grow with usage; a full SCAN of one of these on a hot path is a regression
+HOT_TABLES = {'appointments', 'doctor_availability', 'doctors', 'patients', 'treatments', 'users', 'stat_counters'}
+
+# (username, method, url, json body)
+HOT_REQUESTS = [
+    ('doc0', 'GET', '/api/doctor/dashboard', None),
+    ('doc0', 'GET', '/api/doctor/appointments?status=Booked', None),
+    ('doc0', 'GET', '/api/doctor/patients', None),
+    ('doc0', 'GET', '/api/doctor/patients/{patient}/history', None),
+    ('doc0', 'GET', '/api/doctor/availability', None),
+    ('pat0', 'GET', '/api/patient/dashboard', None),
+    ('pat0', 'GET', '/api/patient/profile', None),
+    ('pat0', 'GET', '/api/patient/treatment-history', None),
+    ('pat0', 'POST', '/api/patient/appointments', 'booking'),
+    ('admin', 'GET', '/api/admin/dashboard', None),
+    ('admin', 'GET', '/api/admin/appointments?status=Booked', None),
+]
+
+_FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+
+def _full_scans(sql, params):
+    plan = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'), params).all()
+    scans = []
+    for row in plan:
+        match = _FULL_SCAN.match(row[-1])
+        if match and match.group(1) in HOT_TABLES:
+            scans.append(row[-1])
+    return scans
+
+
+def test_hot_queries_use_indexes(app, client, login, seed):
+    doctor_ids, patient_ids = seed(n_doctors=3, n_patients=4, n_appointments=30)
+    headers = {username: login(username, 'admin123' if username == 'admin' else 'pw')
+               for username in ('admin', 'doc0', 'pat0')}
+    booking = {
+        'doctor_id': doctor_ids[0],
+        'appointment_date': (date.today() + timedelta(days=2)).isoformat(),
+        'appointment_time': '17:30',
+    }
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and not executemany:
+            captured.append((url, statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', capture)
+    try:
+        for username, method, url, body in HOT_REQUESTS:
+            url = url.format(patient=patient_ids[0])
+            app.redis.flushall()
+            db.session.remove()
+            response = client.open(url, method=method, headers=headers[username],
+                                   json=booking if body == 'booking' else None)
+            assert response.status_code < 400, (url, response.get_json())
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', capture)
+
+    offenders = []
+    for url, statement, parameters in captured:
+        # Positional DBAPI parameters -> named, so text() can bind them
+        named, index = [], 0
+        for part in statement.split('?'):
+            named.append(part)
+            named.append(f':p{index}')
+            index += 1
+        sql = ''.join(named[:-1])
+        params = {f'p{i}': value for i, value in enumerate(parameters)}
+        for scan in _full_scans(sql, params):
+            offenders.append(f'{url}: {scan}\n    {statement.strip()[:200]}')
+    assert not offenders, 'Full table scans on hot paths:\n' + '\n'.join(offenders)
@@ -0,0 +1,69 @@
+"""GET handlers read from the replica bind; writes and a writer's next reads use the primary"""
+import sqlite3
+
+import pytest
+
+from config.config import Config
+from models import db, Patient
+from models.routing import RECENT_WRITE_KEY
+
+
+@pytest.fixture(autouse=True)
+def replica_path(tmp_path, monkeypatch):
+    # Autouse, so this runs before the app fixture creates the engines
+    path = tmp_path / 'replica.db'
+    monkeypatch.setattr(Config, 'SQLALCHEMY_BINDS', {'replica': f'sqlite:///{path}'})
+    # init_app registers a metadata per bind key on the shared db; keep 'replica' out of later tests
+    monkeypatch.setattr(db, 'metadatas', dict(db.metadatas))
+    return path
+
+
+def _copy_primary_to(replica_path):
+    with sqlite3.connect(db.engine.url.database) as primary, sqlite3.connect(replica_path) as replica:
+        primary.backup(replica)
+
+
+def _stored(path, patient_id):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT name, phone FROM patients WHERE id = ?', (patient_id,)).fetchone()
+
+
+def _request(app, client, method, url, **kwargs):
+    # The app fixture holds an app context that requests would share; give each its own g, as a server does
+    with app.app_context():
+        return client.open(url, method=method, **kwargs)
+
+
+def _profile(app, client, headers):
+    response = _request(app, client, 'GET', '/api/patient/profile', headers=headers)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['name'], response.get_json()['phone']
+
+
+def test_reads_use_the_replica_until_the_user_writes(app, client, login, seed, replica_path):
+    _, patient_ids = seed(n_doctors=1, n_patients=1)
+    patient_id = patient_ids[0]
+    user_id = Patient.query.get(patient_id).user_id
+    _copy_primary_to(replica_path)
+    # The replica lags behind a change made on the primary
+    Patient.query.get(patient_id).name = 'Renamed On Primary'
+    db.session.commit()
+    db.session.remove()
+    # Creating the account opened a read-your-writes window for it; let that pass
+    app.redis.delete(RECENT_WRITE_KEY.format(user_id))
+    headers = login('pat0')
+
+    assert _profile(app, client, headers) == ('Patient 0', '5550000')
+
+    response = _request(app, client, 'PUT', '/api/patient/profile', headers=headers, json={'phone': '5551234'})
+    assert response.status_code == 200, response.get_json()
+    assert _stored(db.engine.url.database, patient_id) == ('Renamed On Primary', '5551234')
+    assert _stored(replica_path, patient_id) == ('Patient 0', '5550000')
+
+    # Inside the read-your-writes window the user reads their own write from the primary
+    assert app.redis.exists(RECENT_WRITE_KEY.format(user_id))
+    assert _profile(app, client, headers) == ('Renamed On Primary', '5551234')
+
+    # Once it closes, reads go back to the replica
+    app.redis.delete(RECENT_WRITE_KEY.format(user_id))
+    assert _profile(app, client, headers) == ('Patient 0', '5550000')
@@ -0,0 +1,73 @@
+"""FTS5 search returns what the ILIKE fallback did, and its triggers follow every write"""
+import pytest
+from sqlalchemy import or_, text
+
+from models import db, User, Doctor, Patient
+from models.search import text_search, fts_available
+
+NAMES = ['Anna Schmidt', 'Hannah Smith', 'John Anderson', "Mary O'Brien", 'Zoë Janssen', 'Joanne Smithers']
+
+SEARCHES = [
+    (Patient, ['name', 'phone'], ['smith', 'SMITH', 'ann', 'anderson', "o'b", '555', '0003', 'hann', 'xyz']),
+    (Doctor, ['name', 'specialization'], ['doctor 1', 'cardio', 'OLOGY', 'octor', 'none']),
+]
+
+
+def _ids(query):
+    return sorted(row.id for row in query)
+
+
+def _ilike(model, columns, term):
+    return model.query.filter(or_(*[getattr(model, c).ilike(f'%{term}%') for c in columns]))
+
+
+@pytest.fixture
+def people(seed):
+    doctor_ids, patient_ids = seed(n_doctors=3, n_patients=len(NAMES))
+    for patient_id, name in zip(patient_ids, NAMES):
+        Patient.query.get(patient_id).name = name
+    db.session.commit()
+    return doctor_ids, patient_ids
+
+
+@pytest.mark.parametrize('model, columns, terms', SEARCHES)
+def test_fts_matches_the_ilike_results(people, model, columns, terms):
+    assert fts_available(f'{model.__tablename__}_fts')
+    for term in terms:
+        expected = _ids(_ilike(model, columns, term))
+        fts = text_search(model.query, model, columns, term)
+        assert 'MATCH' in str(fts)
+        assert _ids(fts) == expected, term
+        assert _ids(text_search(model.query, model, columns, term, ranked=True)) == expected, term
+
+
+def _patients_matching(term):
+    return _ids(text_search(Patient.query, Patient, ['name', 'phone'], term))
+
+
+def _check_index():
+    # Compares every indexed row with the content table; raises if they differ
+    db.session.execute(text("INSERT INTO patients_fts(patients_fts, rank) VALUES ('integrity-check', 1)"))
+
+
+def test_triggers_keep_the_index_in_sync(people):
+    user = User(username='newpat', email='newpat@example.com', password='x', role='patient')
+    patient = Patient(user=user, name='Quentin Blake', phone='5559876')
+    db.session.add(patient)
+    db.session.commit()
+    assert _patients_matching('quentin') == [patient.id]
+    assert _patients_matching('59876') == [patient.id]
+    _check_index()
+
+    patient.name = 'Roald Dahl'
+    patient.phone = None
+    db.session.commit()
+    assert _patients_matching('quentin') == []
+    assert _patients_matching('59876') == []
+    assert _patients_matching('roald') == [patient.id]
+    _check_index()
+
+    db.session.delete(patient)
+    db.session.commit()
+    assert _patients_matching('roald') == []
+    _check_index()
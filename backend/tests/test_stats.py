@@ -0,0 +1,29 @@
+"""stat_counters stay equal to a full recount, with or without a dialect-specific upsert"""
+import pytest
+from sqlalchemy import select
+
+import stats
+from models import db, Appointment, StatCounter
+
+
+def _counters():
+    rows = db.session.execute(select(StatCounter.scope, StatCounter.scope_id, StatCounter.name, StatCounter.value))
+    return {(scope, scope_id, name): value for scope, scope_id, name, value in rows if value}
+
+
+@pytest.mark.parametrize('upsert', [True, False], ids=['upsert', 'portable'])
+def test_incremental_counters_match_a_rebuild(app, seed, add_appointments, monkeypatch, upsert):
+    if not upsert:
+        monkeypatch.setattr(stats, '_INSERTS', {})
+    doctor_ids, patient_ids = seed(n_doctors=3, n_patients=4)
+    add_appointments(doctor_ids, patient_ids, 30)
+    add_appointments(doctor_ids, patient_ids, 12, start=30)
+    appointment = Appointment.query.filter_by(status='Booked').first()
+    appointment.status = 'Completed'
+    db.session.delete(Appointment.query.filter_by(status='Cancelled').first())
+    db.session.commit()
+    incremental = _counters()
+
+    stats.rebuild_stats(db.session.connection())
+    db.session.commit()
+    assert incremental == _counters()
@@ -9,31 +9,75 @@ const api = axios.create({
   }
 })
 
+// Last ETag and body per GET url + params, revalidated with If-None-Match
+const etagCache = new Map()
+
+function etagKey(config) {
+  return `${config.url}?${JSON.stringify(config.params || {})}`
+}
+
 // Request interceptor to add token
 api.interceptors.request.use(config => {
   const token = localStorage.getItem('token')
   if (token) {
     config.headers.Authorization = `Bearer ${token}`
   }
+  if (config.method === 'get' && !config.responseType) {
+    const cached = etagCache.get(etagKey(config))
+    if (cached) {
+      config.headers['If-None-Match'] = cached.etag
+      config.validateStatus = status => (status >= 200 && status < 300) || status === 304
+    }
+  }
   return config
 })
 
 // Response interceptor for error handling
 api.interceptors.response.use(
-  response => response,
+  response => {
+    if (response.config.method === 'get' && !response.config.responseType) {
+      const key = etagKey(response.config)
+      const cached = etagCache.get(key)
+      if (response.status === 304 && cached) {
+        // Unchanged: hand back a copy so callers can't mutate the cached body
+        response.status = 200
+        response.data = structuredClone(cached.data)
+      } else if (response.headers.etag) {
+        etagCache.set(key, { etag: response.headers.etag, data: structuredClone(response.data) })
+      }
+    }
+    return response
+  },
   error => {
     if (error.response?.status === 401) {
       localStorage.removeItem('token')
       localStorage.removeItem('user')
+      etagCache.clear()
       window.location.href = '/login'
     }
     return Promise.reject(error)
   }
 )
 
+// Largest page the API serves (MAX_PAGE_SIZE in models/queries.py)
+const PAGE_LIMIT = 200
+
+// Follow keyset pagination cursors and return all items of a paginated list endpoint
+async function fetchAllPages(url, params = {}) {
+  const items = []
+  let cursor = null
+  do {
+    const response = await api.get(url, { params: { ...params, limit: PAGE_LIMIT, cursor: cursor || undefined } })
+    items.push(...response.data.items)
+    cursor = response.data.next_cursor
+  } while (cursor)
+  return items
+}
+
 export const authService = {
   async login(username, password) {
     const response = await api.post('/auth/login', { username, password })
+    etagCache.clear()
     if (response.data.access_token) {
       localStorage.setItem('token', response.data.access_token)
       localStorage.setItem('user', JSON.stringify(response.data.user))
@@ -54,6 +98,7 @@ export const authService = {
   logout() {
     localStorage.removeItem('token')
     localStorage.removeItem('user')
+    etagCache.clear()
   },
 
   getUser() {
@@ -78,8 +123,7 @@ export const adminService = {
   },
 
   async getDoctors(search = '') {
-    const response = await api.get('/admin/doctors', { params: { search } })
-    return response.data
+    return fetchAllPages('/admin/doctors', { search })
   },
 
   async createDoctor(doctorData) {
@@ -98,8 +142,7 @@ export const adminService = {
   },
 
   async getPatients(search = '') {
-    const response = await api.get('/admin/patients', { params: { search } })
-    return response.data
+    return fetchAllPages('/admin/patients', { search })
   },
 
   async updatePatient(patientId, patientData) {
@@ -113,8 +156,7 @@ export const adminService = {
   },
 
   async getAppointments(status = '') {
-    const response = await api.get('/admin/appointments', { params: { status } })
-    return response.data
+    return fetchAllPages('/admin/appointments', { status })
   },
 
   async search(query, type = 'all') {
@@ -130,8 +172,7 @@ export const doctorService = {
   },
 
   async getAppointments(status = '') {
-    const response = await api.get('/doctor/appointments', { params: { status } })
-    return response.data
+    return fetchAllPages('/doctor/appointments', { status })
   },
 
   async completeAppointment(appointmentId, treatmentData) {
@@ -145,8 +186,7 @@ export const doctorService = {
   },
 
   async getPatients() {
-    const response = await api.get('/doctor/patients')
-    return response.data
+    return fetchAllPages('/doctor/patients')
   },
 
   async getPatientHistory(patientId) {
@@ -207,12 +247,12 @@ export const patientService = {
   },
 
   async getTreatmentHistory() {
-    const response = await api.get('/patient/treatment-history')
-    return response.data
+    return fetchAllPages('/patient/treatment-history')
   },
 
   async exportTreatments() {
-    const response = await api.get('/patient/export-treatments')
+    // Streamed CSV download; returned as a Blob
+    const response = await api.get('/patient/export-treatments', { responseType: 'blob' })
     return response.data
   },
 
@@ -224,6 +264,11 @@ export const patientService = {
   async getExportStatus(taskId) {
     const response = await api.get(`/patient/export-treatments/status/${taskId}`)
     return response.data
+  },
+
+  async downloadExport(taskId) {
+    const response = await api.get(`/patient/export-treatments/download/${taskId}`, { responseType: 'blob' })
+    return response.data
   }
 }
 